@@ -6,34 +6,150 @@ import sys
 import math
 import time
 import argparse
+import random
+import tracemalloc
+import tempfile
 import numpy
 from decimal import Decimal
 # tutoriel numpy : http://www.scipy.org/Tentative_NumPy_Tutorial
 
+class LinkageTree:
+	""" Tableau des fusions d'un clustering hiérarchique, à la manière de scipy.cluster.hierarchy.linkage :
+	les noeuds 0..n-1 sont les objets, le noeud n+i est celui créé par la i-ème fusion.
+	Une fusion coûte O(1) (une ligne du tableau), les membres d'un noeud sont calculés à la demande
+	par un parcours itératif (pas de pb de récursion trop profonde)
+	Membres :
+	- names : la liste des noms d'objets (feuilles)
+	- children : tableau numpy (n-1, 2), les deux noeuds fils de chaque fusion
+	- sims : liste des similarités de chaque fusion
+	- sizes : tableau numpy (2n-1), le nb d'objets de chaque noeud
+	- first : tableau numpy (2n-1), le plus petit id d'objet de chaque noeud (qui identifie le cluster, cf. HAC)
+	- nb_merges : le nb de fusions effectuées
+	Les fusions étant enregistrées par similarité décroissante, couper l'arbre en k clusters revient
+	à ne garder que les n-k premières fusions (cf. cut et cut_at) : O(n) par coupe, sans refaire le clustering
+	"""
+	def __init__(self, names):
+		self.names = names
+		n = len(names)
+		self.children = numpy.zeros((max(n - 1, 0), 2), dtype=numpy.int64)
+		self.sims = []
+		self.sizes = numpy.ones(max(2 * n - 1, 0), dtype=numpy.int64)
+		self.first = numpy.arange(max(2 * n - 1, 0))
+		self.nb_merges = 0
+
+	def leaf(self, i):
+		""" Le dendrogramme singleton de l'objet d'id i """
+		return Dendrogram(self, i)
+
+	def merge(self, dendrogram1, dendrogram2, sim):
+		""" Enregistre la fusion de deux dendrogrammes à la similarité sim, et retourne le dendrogramme fusionné """
+		node = len(self.names) + self.nb_merges
+		self.children[self.nb_merges] = (dendrogram1.node, dendrogram2.node)
+		self.sims.append(sim)
+		self.sizes[node] = self.sizes[dendrogram1.node] + self.sizes[dendrogram2.node]
+		self.first[node] = min(self.first[dendrogram1.node], self.first[dendrogram2.node])
+		self.nb_merges += 1
+		return Dendrogram(self, node)
+
+	def leaves(self, node):
+		""" La liste à plat des ids d'objets du noeud, de gauche à droite (parcours itératif) """
+		n = len(self.names)
+		leaves = []
+		stack = [node]
+		while stack:
+			node = stack.pop()
+			if node < n:
+				leaves.append(node)
+			else:
+				child1, child2 = self.children[node - n]
+				stack.append(int(child2))
+				stack.append(int(child1))
+		return leaves
+
+	def members(self, node):
+		""" La liste à plat des objets du noeud, de gauche à droite """
+		return [ self.names[leaf] for leaf in self.leaves(node) ]
+
+	def roots(self, nb_merges):
+		""" Les noeuds racines une fois effectuées les nb_merges premières fusions,
+		rangés par plus petit id d'objet (l'ordre des clusters de HAC) ; O(n) """
+		n = len(self.names)
+		alive = numpy.ones(n + nb_merges, dtype=bool)
+		alive[self.children[:nb_merges].ravel()] = False
+		roots = numpy.flatnonzero(alive)
+		by_first = numpy.full(n, -1)
+		by_first[self.first[roots]] = roots
+		return by_first[by_first >= 0]
+
+	def cut(self, nbclusters):
+		""" Coupe l'arbre en nbclusters clusters (au moins) : liste de Dendrogram """
+		nb_merges = min(self.nb_merges, max(0, len(self.names) - nbclusters))
+		return [ Dendrogram(self, int(node)) for node in self.roots(nb_merges) ]
+
+	def cut_at(self, threshold):
+		""" Coupe l'arbre au seuil de similarité threshold : les clusters obtenus par les fusions de similarité >= threshold """
+		nb_merges = next((i for i, sim in enumerate(self.sims) if sim < threshold), self.nb_merges)
+		return [ Dendrogram(self, int(node)) for node in self.roots(nb_merges) ]
+
+	def labels(self, clusters):
+		""" Tableau numpy donnant pour chaque objet le rang de son cluster dans clusters (une coupe de l'arbre) """
+		labels = numpy.full(len(self.names), -1)
+		for c, cluster in enumerate(clusters):
+			labels[self.leaves(cluster.node)] = c
+		return labels
+
+	def linkage_matrix(self):
+		""" Les fusions au format de scipy.cluster.hierarchy : tableau (nb_merges, 4) de lignes
+		(fils1, fils2, similarité, nb d'objets) ; attention, la 3e colonne est une similarité, pas une distance """
+		n = len(self.names)
+		matrix = numpy.zeros((self.nb_merges, 4))
+		matrix[:, :2] = self.children[:self.nb_merges]
+		matrix[:, 2] = [ float(sim) for sim in self.sims ]
+		matrix[:, 3] = self.sizes[n:n + self.nb_merges]
+		return matrix
+
 class Dendrogram:
 	""" Un dendrogramme : utilisé pour représenter tout cluster obtenu par clustering hiérarchique
-	Contient 
+	Simple référence à un noeud d'un LinkageTree, qui contient
 	- soit un seul objet (cluster singleton), dans self.child1 (et child2 vaut None)
 	- soit une paire de dendrogrammes (les 2 noeuds fils) et leur similarité
 	Membres :
+	- tree : le LinkageTree contenant le noeud
+	- node : l'id du noeud dans tree
 	- child1 : string (si singleton) ou instance de Dendrogram
 	- child2 : None (si singleton) ou instance de Dendrogram
 	- sim : similarité entre child1 et child2
-	- members : la liste à plat des objets contenus dans le dendrogramme (cf. pb de récursion trop profonde)
+	- members : la liste à plat des objets contenus dans le dendrogramme (calculée à la demande)
 	"""
-	def __init__(self, child1, child2=None, sim=0):
-		self.sim = sim
-		self.child1 = child1
-		self.child2 = child2
-		# on stocke au fur et à mesure la string d'affichage, pour éviter les pbs de récursion trop profonde
-		if child2 == None:
-			self.members = [ child1 ]
-		else:
-			self.members = child1.members + child2.members
+	def __init__(self, tree, node):
+		self.tree = tree
+		self.node = node
 
 	def is_singleton(self):
 		""" Retourne True s'il s'agit d'un cluster réduit à un seul objet, False sinon """
-		return (self.child2 == None)
+		return self.node < len(self.tree.names)
+
+	@property
+	def child1(self):
+		if self.is_singleton():
+			return self.tree.names[self.node]
+		return Dendrogram(self.tree, int(self.tree.children[self.node - len(self.tree.names)][0]))
+
+	@property
+	def child2(self):
+		if self.is_singleton():
+			return None
+		return Dendrogram(self.tree, int(self.tree.children[self.node - len(self.tree.names)][1]))
+
+	@property
+	def sim(self):
+		if self.is_singleton():
+			return 0
+		return self.tree.sims[self.node - len(self.tree.names)]
+
+	@property
+	def members(self):
+		return self.tree.members(self.node)
 
 	def print_members(self, stream):
 		""" écrit la liste d'objets présents dans le cluster 
@@ -41,36 +157,128 @@ class Dendrogram:
 		stream.write(' '.join( [ x for x in self.members ] ))
 	
 	def __str__(self):
-		""" Affichage parenthésé du dendrogramme (illisible si dendrogramme trop gros...) """
-		if self.is_singleton():
-			return str(self.child1)
-		return str(self.sim) + ':(' + str(self.child1) + ' + ' + str(self.child2) + ')'
+		""" Affichage parenthésé du dendrogramme (illisible si dendrogramme trop gros...),
+		construit itérativement : la pile contient des ids de noeuds et des morceaux de texte """
+		tree = self.tree
+		n = len(tree.names)
+		parts = []
+		stack = [self.node]
+		while stack:
+			item = stack.pop()
+			if isinstance(item, str):
+				parts.append(item)
+			elif item < n:
+				parts.append(str(tree.names[item]))
+			else:
+				child1, child2 = tree.children[item - n]
+				stack += [ ')', int(child2), ' + ', int(child1), str(tree.sims[item - n]) + ':(' ]
+		return ''.join(parts)
+
+class CondensedMatrix:
+	""" Matrice de similarité symétrique stockée en demi-matrice condensée : le triangle supérieur sans la diagonale,
+	rangé ligne par ligne (comme scipy.spatial.distance.squareform), dans un fichier projeté en mémoire (numpy.memmap).
+	n(n-1)/2 cases sur disque : seules les pages lues ou modifiées sont en mémoire, et le système peut les libérer.
+	S'utilise comme une matrice numpy pour ce dont HAC a besoin : m[c] (copie de la ligne c), m[c1, c2], shape, dtype,
+	et set_row pour réécrire une ligne (et donc la colonne) en place
+	"""
+	def __init__(self, filename, n, dtype=numpy.float64, mode='w+'):
+		self.n = n
+		self.shape = (n, n)
+		self.dtype = numpy.dtype(dtype)
+		self.data = numpy.memmap(filename, dtype=self.dtype, mode=mode, shape=(max(n * (n - 1) // 2, 1),))
+
+	def index(self, i, j):
+		""" Position de la case (i, j), i < j, dans la demi-matrice (i et j peuvent être des tableaux numpy) """
+		return i * (2 * self.n - i - 1) // 2 + j - i - 1
+
+	def __getitem__(self, key):
+		if isinstance(key, tuple):
+			(i, j) = key
+			if i == j:
+				return self.dtype.type(0)
+			return self.data[self.index(min(i, j), max(i, j))]
+		c = key
+		row = numpy.zeros(self.n, dtype=self.dtype)
+		# la colonne c au-dessus de la diagonale, puis la fin de la ligne c (contiguë)
+		row[:c] = self.data[self.index(numpy.arange(c), c)]
+		start = self.index(c, c + 1)
+		row[c + 1:] = self.data[start:start + self.n - c - 1]
+		return row
+
+	def __setitem__(self, key, val):
+		(i, j) = key
+		if i != j:
+			self.data[self.index(min(i, j), max(i, j))] = val
+
+	def set_row(self, c, row):
+		""" Affecte row comme ligne c (et donc colonne c) de la matrice """
+		self.data[self.index(numpy.arange(c), c)] = row[:c]
+		start = self.index(c, c + 1)
+		self.data[start:start + self.n - c - 1] = row[c + 1:]
+
+def find(parent, c):
+	""" Union-find : racine de l'ensemble contenant c (avec compression de chemin par moitiés) """
+	while parent[c] != c:
+		parent[c] = parent[parent[c]]
+		c = parent[c]
+	return c
+
+# critères de similarité entre clusters (cf. lance_williams)
+LINKAGES = [ "single", "complete", "average", "ward" ]
+
+def lance_williams(linkage, s1, s2, s12, n1, n2, nk):
+	""" Similarités entre le cluster fusionné c1+c2 et tous les clusters k, par la formule de Lance-Williams
+	s = a1.s1k + a2.s2k + b.s12 + g.|s1k - s2k|, calculée d'un coup sur toute la ligne :
+	s1, s2 = lignes de c1 et c2, s12 = sim(c1, c2), n1, n2 = tailles de c1 et c2, nk = tableau des tailles des clusters
+	(a1 + a2 + b = 1, donc la formule sur les distances 1 - s donne la même formule sur les similarités, au signe de g près)
+	"""
+	if linkage == "single":
+		# a1 = a2 = 1/2, b = 0, g = 1/2 : le max
+		return numpy.maximum(s1, s2)
+	if linkage == "complete":
+		# a1 = a2 = 1/2, b = 0, g = -1/2 : le min
+		return numpy.minimum(s1, s2)
+	if linkage == "average":
+		# ai = ni / (n1 + n2), b = g = 0 : moyenne des similarités entre objets
+		return (n1 * s1 + n2 * s2) / (n1 + n2)
+	# ward : ai = (ni + nk) / (n1 + n2 + nk), b = - nk / (n1 + n2 + nk), g = 0
+	return ((n1 + nk) * s1 + (n2 + nk) * s2 - nk * s12) / (n1 + n2 + nk)
 
 class HAC:
 	"""
-	Classe implémentant le single-link hierarchical agglomerative clustering
+	Classe implémentant le hierarchical agglomerative clustering (single-link, complete-link, average-link ou Ward),
+	par l'algorithme de la chaîne des plus proches voisins (NN-chain) : O(n²) au total
 
 	Membres:
 	* clusters : liste python de clusters, de type Dendrogram 
 				 (éventuellement réduits à un seul objet)
-				 IMPORTANT: le rang dans cette liste sert d'id de cluster dans les autres membres 
-				 (matrice de sim, et ppc)
-	* sim_matrix : matrice de similarite entre clusters (type numpy.ndarray)
-	* ppc : Liste de paires :
-			pour chaque cluster, identifié par son rang,
-			stocke une paire (similarité avec le ppc, ppc)
+	* tree : le LinkageTree où sont enregistrées toutes les fusions (cf. build_clusters, cut, cut_at)
+	* sim_matrix : matrice de similarite entre clusters (type numpy.ndarray, ou CondensedMatrix sur disque), symétrique
+				 IMPORTANT: un cluster est identifié par une ligne de la matrice ; 
+				 un cluster fusionné prend la ligne du plus petit id de ses deux fils
+				 (son id est donc celui de son premier objet)
+	* actif : tableau de booléens, actif[c] est vrai si c identifie un cluster courant
+	* sizes : tableau des tailles (nb d'objets) des clusters, du type de sim_matrix
+	* merges : liste des fusions (similarité, c1, c2), dans l'ordre où la chaîne les a trouvées
+	* linkage : "single" (similarité entre clusters = max des similarités entre objets)
+				ou "complete" (min des similarités entre objets)
+				ou "average" (moyenne des similarités entre objets)
+				ou "ward" (critère de Ward, sur la distance 1 - similarité)
+				cf. LINKAGES et lance_williams
 	"""
-	def __init__(self, trace):
+	def __init__(self, trace, linkage = "single"):
 		self.clusters = []
+		self.tree = None
 		self.sim_matrix = None
-		self.ppc = []
-		self.actif = []
+		self.actif = None
+		self.sizes = None
+		self.merges = []
+		self.linkage = linkage
 
 		self.trace = trace
 
 	def get_sim_c(self, c1, c2):
-		""" Retourne la similarite entre les clusters d'id c1 et c2 
-		( gere le fait que dans la matrice ne sont remplies que les cases c1 < c2) """
+		""" Retourne la similarite entre les clusters d'id c1 et c2 """
 		if c1 != c2:
 			return self.sim_matrix[c1,c2]
 		else :
@@ -78,82 +286,159 @@ class HAC:
 
 	def set_sim_c(self, c1, c2, val):
 		""" Affecte la valeur val comme similarite des clusters d'id c1 et c2
-		(gere le stockage en partie superieure de la matrice uniquement)
+		(la matrice reste symétrique)
 		"""
 		self.sim_matrix[c1,c2] = val
 		self.sim_matrix[c2,c1] = val
 
+	def set_row(self, c, row):
+		""" Affecte row comme similarités du cluster c à tous les clusters (ligne et colonne c) """
+		if isinstance(self.sim_matrix, CondensedMatrix):
+			self.sim_matrix.set_row(c, row)
+		else:
+			self.sim_matrix[c, :] = row
+			self.sim_matrix[:, c] = row
+
 	def initialize_clustering(self, object_names, sim_matrix):
 		"""
 		Initialisation de 
 		- la liste des clusters (les singletons d'objets)
-		- la liste des ppc (clusters les plus proches de chaque cluster)
-		- la matrice (fournie en argument)
+		- la matrice (fournie en argument), symétrisée en gardant la plus grande des deux similarités
+		  (la matrice est utilisée et modifiée en place, sans copie en mémoire ; une CondensedMatrix est déjà symétrique)
 		"""
-		# matrice de similarité entre clusters (au départ entre objets)
-		self.sim_matrix = sim_matrix
-
 		# le nb d'objets
 		self.nb_objects = len(object_names)
 		if self.nb_objects != sim_matrix.shape[0]:
 			exit("La matrice et la liste d'objets ne sont pas de meme taille! J'arrête tout!")
-		self.actif = list(range(len(object_names)))
-		
-		#Création des premiers plus proches clusters
-		for i in range(len(object_names)) : 
-			key = numpy.argmax(sim_matrix[i,:])
-			self.ppc.append((max(sim_matrix[i,:]),  key))
-			self.clusters.append(Dendrogram(object_names[i]))
-		
-		
+
+		# matrice de similarité entre clusters (au départ entre objets)
+		if not isinstance(sim_matrix, CondensedMatrix):
+			symmetrize(sim_matrix)
+		self.sim_matrix = sim_matrix
+		self.actif = numpy.ones(self.nb_objects, dtype = bool)
+		# tailles du type de la matrice (entiers python pour Decimal, qui ne se mélange pas aux entiers numpy)
+		self.sizes = numpy.ones(self.nb_objects, dtype = self.sim_matrix.dtype)
+		self.merges = []
+		self.tree = LinkageTree(object_names)
+		self.clusters = [ self.tree.leaf(i) for i in range(self.nb_objects) ]
+
+	def nearest(self, c, preferred = None):
+		""" Retourne l'id du cluster courant le plus similaire au cluster c
+		(en cas d'égalité, preferred s'il fait partie des plus similaires) """
+		row = numpy.where(self.actif, self.sim_matrix[c], -numpy.inf)
+		row[c] = -numpy.inf
+		best = int(numpy.argmax(row))
+		if preferred is not None and row[preferred] >= row[best]:
+			return preferred
+		return best
+
+	def merge(self, c1, c2):
+		""" Fusionne les clusters c1 et c2 (c1 < c2) : le cluster fusionné prend la ligne c1,
+		mise à jour en une seule opération vectorielle sur toute la ligne (formule de Lance-Williams) """
+		self.merges.append((self.sim_matrix[c1, c2], c1, c2))
+		row = lance_williams(self.linkage, self.sim_matrix[c1], self.sim_matrix[c2], self.sim_matrix[c1, c2],
+							 self.sizes[c1], self.sizes[c2], self.sizes)
+		self.set_row(c1, row)
+		self.sizes[c1] += self.sizes[c2]
+		self.actif[c2] = False
+
 	def clusterize(self, object_names, sim_matrix, nbclusters=1):
 		""" Calcule le clustering étant donnés :
 		object_names = une liste de noms d'objets (dont le rang constitue l'id)
 		sim_matrix   = une matrice de similarite entre ces objets
 		nbclusters   = le nb de clusters voulus
+
+		La chaîne des plus proches voisins calcule toutes les fusions (dendrogramme complet) ;
+		tous les critères de LINKAGES étant réductibles, les fusions triées par similarité décroissante
+		sont celles de l'algorithme glouton, et on applique les nb_objets - nbclusters premières.
 		"""
 		self.initialize_clustering(object_names, sim_matrix)
 		if self.trace :
 			for i in self.clusters :
 				print(i)
-		while len(self.actif) > nbclusters :
-			similar, to_merge = max(self.ppc)
-			mergeur = numpy.argmax(self.ppc, axis = 0)[0]
-
-			k = 0
-			for clu in self.ppc :
-				if clu[1] == to_merge:
-					self.ppc[k] = (clu[0], mergeur)
-				k += 1
-			
-			sim_matrix[: ,to_merge] = numpy.zeros(sim_matrix.shape[0])
-			self.ppc[mergeur] = (max(sim_matrix[mergeur,:]), numpy.argmax(sim_matrix[mergeur,:]) )
-			self.ppc[to_merge] = (0,-1)
-			self.actif.remove(to_merge)
-			if self.trace:
+		chain = []
+		for step in range(self.nb_objects - 1):
+			if not chain :
+				chain.append(int(numpy.flatnonzero(self.actif)[0]))
+			# on remonte la chaîne jusqu'à une paire de plus proches voisins réciproques
+			while True:
+				previous = chain[-2] if len(chain) > 1 else None
+				best = self.nearest(chain[-1], previous)
+				if best == previous:
+					break
+				chain.append(best)
+			c1 = chain.pop()
+			c2 = chain.pop()
+			self.merge(min(c1, c2), max(c1, c2))
+
+		self.build_clusters(object_names, nbclusters)
+
+	def clusterize_graph(self, object_names, graph, nbclusters=1):
+		""" Calcule le clustering single-link à partir du graphe creux des similarités (cf. thesaurus2graph),
+		sans matrice n x n : les fusions sont les arêtes de la forêt couvrante de similarité maximale ;
+		les composantes connexes restantes fusionnent ensuite à similarité nulle (comme avec la matrice).
+		"""
+		self.nb_objects = len(object_names)
+		self.tree = LinkageTree(object_names)
+		self.clusters = [ self.tree.leaf(i) for i in range(self.nb_objects) ]
+		if self.trace :
+			for i in self.clusters :
+				print(i)
+		self.merges = maximum_spanning_forest(self.nb_objects, graph)
+
+		parent = list(range(self.nb_objects))
+		for similar, c1, c2 in self.merges:
+			parent[find(parent, c2)] = find(parent, c1)
+		roots = sorted(set(find(parent, c) for c in range(self.nb_objects)))
+		zero = numpy.zeros(1, dtype=graph[0].dtype)[0]
+		self.merges += [ (zero, roots[0], root) for root in roots[1:] ]
+
+		self.build_clusters(object_names, nbclusters)
+
+	def build_clusters(self, object_names, nbclusters):
+		""" Enregistre dans self.tree le dendrogramme complet, en appliquant les fusions de self.merges
+		par similarité décroissante, puis le coupe en nbclusters clusters """
+		parent = list(range(self.nb_objects))
+		merges = sorted(self.merges, key = lambda merge : merge[0], reverse = True)
+		for step, (similar, c1, c2) in enumerate(merges):
+			mergeur, to_merge = sorted((find(parent, c1), find(parent, c2)))
+			if self.trace and step < self.nb_objects - nbclusters:
 				print("Merged", object_names[to_merge],
 					"with",	object_names[mergeur],
 					"at",		similar)
-			
-			self.clusters[mergeur] = Dendrogram(\
-								self.clusters[mergeur],\
-								self.clusters[to_merge],\
-								similar)
+			self.clusters[mergeur] = self.tree.merge(self.clusters[mergeur],
+													 self.clusters[to_merge],
+													 similar)
 			self.clusters[to_merge] = None
-		
-		self.clusters = filter(lambda a: a, self.clusters)
+			parent[to_merge] = mergeur
 
-	def dump(self,stream):
-		""" Affichage des membres des clusters, en l'état courant du clustering hiérarchique """
-		for c,cl in enumerate(self.clusters):
+		self.clusters = self.cut(nbclusters)
+
+	def cut(self, nbclusters):
+		""" Les nbclusters clusters obtenus en coupant le dendrogramme calculé (sans refaire le clustering) """
+		return self.tree.cut(nbclusters)
+
+	def cut_at(self, threshold):
+		""" Les clusters obtenus en coupant le dendrogramme calculé au seuil de similarité threshold """
+		return self.tree.cut_at(threshold)
+
+	def dump(self, stream, clusters=None):
+		""" Affichage des membres des clusters, en l'état courant du clustering hiérarchique
+		(ou d'une autre coupe du dendrogramme, cf. cut et cut_at) """
+		if clusters is None:
+			clusters = self.clusters
+		for c,cl in enumerate(clusters):
 			stream.write('Cluster ' + str(c) + ' = ')
 			cl.print_members(stream)
 			stream.write('\n')
 
-def thesaurus2simmatrix(thesaurusstream):
+# types possibles pour la matrice de similarité (Decimal : calcul exact, mais tableau d'objets python)
+DTYPES = { "float32" : numpy.float32, "float64" : numpy.float64, "decimal" : Decimal }
+
+def read_thesaurus(thesaurusstream, dtype=numpy.float64):
 	""" Lit un stream contenant un thesaurus au format "un objet par ligne, et ses similaires separes par tab"
 	et construit la liste des objets representes, 
-	et une matrice de similarite entre ces objets
+	et un dictionnaire de dictionnaires id1 => id2 => sim(id1,id2) (sim de type dtype, cf. DTYPES)
 	"""
 	# dictionnaire de dictionnaire, pour la sim entre 2 objets
 	# clé1=id1 clé2=id2 val= sim(id1,id2)
@@ -180,7 +465,7 @@ def thesaurus2simmatrix(thesaurusstream):
 			if not objsim:
 				continue
 			(object2, sim) = objsim.split(':', 1)
-			sim = Decimal(sim)
+			sim = Decimal(sim) if dtype is Decimal else float(sim)
 			if object2 not in object2id:
 				id += 1
 				object2id[object2] = id
@@ -194,11 +479,29 @@ def thesaurus2simmatrix(thesaurusstream):
 
 		line = thesaurusstream.readline()
 
+	return (objects, object2objectsim)
+
+def symmetrize(matrix):
+	""" Symétrise la matrice carrée en place, en gardant la plus grande des deux similarités, ligne par ligne :
+	mémoire supplémentaire O(n) (numpy.maximum(matrix, matrix.T) créerait une seconde matrice n x n) """
+	for i in range(matrix.shape[0] - 1):
+		row = numpy.maximum(matrix[i, i+1:], matrix[i+1:, i])
+		matrix[i, i+1:] = row
+		matrix[i+1:, i] = row
+
+def thesaurus2simmatrix(thesaurusstream, dtype=numpy.float64):
+	""" Lit un stream contenant un thesaurus (cf. read_thesaurus)
+	et construit la liste des objets representes, 
+	et une matrice de similarite entre ces objets, de type dtype (cf. DTYPES)
+	"""
+	(objects, object2objectsim) = read_thesaurus(thesaurusstream, dtype)
+
 	# nb d'objets à clusteriser
 	n = len( objects )
 
 	# matrice nxn, remplie avec des 0 (objet numpy.ndarray : tableau multi-dimensionnel)
-	matrix = numpy.zeros( (n,n), dtype=Decimal )
+	# de type dtype, y compris pour Decimal (numpy.zeros mettrait des entiers python)
+	matrix = numpy.full( (n,n), dtype(0), dtype=dtype )
 
 	for id1 in object2objectsim:
 		for id2 in object2objectsim[id1]:
@@ -208,8 +511,164 @@ def thesaurus2simmatrix(thesaurusstream):
 
 	return (objects, matrix)
 
+def thesaurus2graph(thesaurusstream, dtype=numpy.float64):
+	""" Lit un stream contenant un thesaurus (cf. read_thesaurus)
+	et construit la liste des objets representes, 
+	et le graphe creux des similarités : tableaux (sims, ids1, ids2) des arêtes, en mémoire O(nb d'arêtes)
+	"""
+	(objects, object2objectsim) = read_thesaurus(thesaurusstream, dtype)
+	sims = []
+	ids1 = []
+	ids2 = []
+	for id1 in object2objectsim:
+		for id2 in object2objectsim[id1]:
+			sims.append(object2objectsim[id1][id2])
+			ids1.append(id1)
+			ids2.append(id2)
+	return (objects, (numpy.array(sims, dtype=dtype), numpy.array(ids1, dtype=numpy.int32), numpy.array(ids2, dtype=numpy.int32)))
+
+def thesaurus2condensed(thesaurusstream, filename, dtype=numpy.float64):
+	""" Lit un stream contenant un thesaurus (cf. read_thesaurus)
+	et construit la liste des objets representes,
+	et la matrice de similarite entre ces objets en demi-matrice condensée dans le fichier filename (cf. CondensedMatrix),
+	sans jamais construire de matrice n x n en mémoire ; elle est symétrisée à la lecture (plus grande des deux similarités)
+	"""
+	(objects, (sims, ids1, ids2)) = thesaurus2graph(thesaurusstream, dtype)
+	matrix = CondensedMatrix(filename, len(objects), dtype)
+	# on ne stocke que la demi-matrice : uniquement les id2 superieurs aux id1
+	keep = ids1 != ids2
+	id1 = numpy.minimum(ids1, ids2)[keep].astype(numpy.int64)
+	id2 = numpy.maximum(ids1, ids2)[keep].astype(numpy.int64)
+	numpy.maximum.at(matrix.data, matrix.index(id1, id2), sims[keep])
+	matrix.data.flush()
+	return (objects, matrix)
+
+def maximum_spanning_forest(n, graph):
+	""" Algorithme de Kruskal : arêtes (sim, id1, id2) de la forêt couvrante de similarité maximale du graphe,
+	par similarité décroissante, en O(E log E). Ce sont exactement les fusions du single-link. """
+	(sims, ids1, ids2) = graph
+	parent = list(range(n))
+	merges = []
+	for e in numpy.argsort(-sims, kind='stable'):
+		root1 = find(parent, int(ids1[e]))
+		root2 = find(parent, int(ids2[e]))
+		if root1 != root2:
+			parent[root2] = root1
+			merges.append((sims[e], int(ids1[e]), int(ids2[e])))
+			if len(merges) == n - 1:
+				break
+	return merges
+
+def generate_thesaurus(stream, n, nb_similar=20, seed=0):
+	""" Ecrit dans stream un thesaurus aléatoire de n mots, ayant chacun nb_similar similaires
+	(similarités à 3 décimales, symétriques) """
+	rng = random.Random(seed)
+	similar = [ {} for i in range(n) ]
+	for id1 in range(n):
+		for id2 in rng.sample(range(n), min(nb_similar, n)):
+			if id2 != id1 and id2 not in similar[id1]:
+				sim = "%.3f" % rng.random()
+				similar[id1][id2] = sim
+				similar[id2][id1] = sim
+	for id1 in range(n):
+		stream.write('\t'.join(["w%d" % id1] + [ "w%d:%s" % (id2, sim) for id2, sim in similar[id1].items() ]) + '\n')
+
+def cluster_members(clusters):
+	""" Liste des membres de chaque cluster (pour comparer deux clusterings) """
+	return [ list(cluster.members) for cluster in clusters ]
+
+def compare_clusterings(reference, hac):
+	""" Compare le clustering hac au clustering de référence (calcul exact) : mêmes clusters, ou au moins
+	fusions aux mêmes similarités (à la précision float32 près), les clusters ne différant alors
+	que par l'ordre de fusions de même similarité """
+	if cluster_members(reference.clusters) == cluster_members(hac.clusters):
+		return "même clustering que Decimal"
+	sims1 = sorted(float(merge[0]) for merge in reference.merges)
+	sims2 = sorted(float(merge[0]) for merge in hac.merges)
+	if len(sims1) == len(sims2) and numpy.allclose(sims1, sims2, rtol=1e-6):
+		return "mêmes similarités de fusion que Decimal (clusters différents seulement par l'ordre de fusions de même similarité)"
+	return "clustering DIFFERENT de Decimal !"
+
+def parse_cuts(string, type=int):
+	""" Liste de coupes "2,5,10-20" => [2, 5, 10, 11, ..., 20] (intervalles pour les nbs de clusters seulement) """
+	cuts = []
+	for cut in string.split(','):
+		if type is int and '-' in cut:
+			(first, last) = cut.split('-')
+			cuts += range(int(first), int(last) + 1)
+		else:
+			cuts.append(type(cut))
+	return cuts
+
+def export_cuts(stream, hac, cuts):
+	""" Ecrit dans stream un tableau objet x coupe : le numéro de cluster de chaque objet,
+	pour chaque coupe (nom, clusters) de cuts """
+	labels = [ hac.tree.labels(clusters) for (name, clusters) in cuts ]
+	stream.write('\t'.join(["objet"] + [ name for (name, clusters) in cuts ]) + '\n')
+	for id, object_name in enumerate(hac.tree.names):
+		stream.write('\t'.join([object_name] + [ str(label[id]) for label in labels ]) + '\n')
+
+def benchmark(thesaurus_file, nbclusters, linkage):
+	""" Mémoire de la matrice (mesurée par tracemalloc, objets Decimal compris), pic de mémoire pendant le clustering
+	(matrice comprise) et temps de lecture et de clustering, pour chaque type de matrice ;
+	vérifie que les clusterings obtenus sont ceux du calcul exact (Decimal) """
+	results = {}
+	for name in ["float32", "float64", "decimal"]:
+		start = time.time()
+		tracemalloc.start()
+		(object_names, simmatrix) = thesaurus2simmatrix(open(thesaurus_file), DTYPES[name])
+		memory = tracemalloc.get_traced_memory()[0]
+		read_time = time.time() - start
+
+		start = time.time()
+		tracemalloc.reset_peak()
+		hac = HAC(trace=0, linkage=linkage)
+		hac.clusterize(object_names, simmatrix, nbclusters=nbclusters)
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		hac.sim_matrix = None
+		results[name] = hac
+		del simmatrix
+		sys.stdout.write("%s\tmatrice+lecture : %.1f Mo\tpic clustering : %.1f Mo\tlecture : %.2f s\tclustering : %.2f s\n" % (name, memory / 2**20, peak / 2**20, read_time, time.time() - start))
+	if linkage == "single":
+		start = time.time()
+		tracemalloc.start()
+		(object_names, graph) = thesaurus2graph(open(thesaurus_file))
+		memory = tracemalloc.get_traced_memory()[0]
+		read_time = time.time() - start
+
+		start = time.time()
+		tracemalloc.reset_peak()
+		hac = HAC(trace=0, linkage=linkage)
+		hac.clusterize_graph(object_names, graph, nbclusters=nbclusters)
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		results["graph"] = hac
+		sys.stdout.write("graph\tgraphe+lecture : %.1f Mo\tpic clustering : %.1f Mo\tlecture : %.2f s\tclustering : %.2f s\n" % (memory / 2**20, peak / 2**20, read_time, time.time() - start))
+	with tempfile.TemporaryDirectory() as tmpdir:
+		start = time.time()
+		tracemalloc.start()
+		(object_names, simmatrix) = thesaurus2condensed(open(thesaurus_file), os.path.join(tmpdir, "matrix"), numpy.float32)
+		memory = tracemalloc.get_traced_memory()[0]
+		read_time = time.time() - start
+
+		start = time.time()
+		tracemalloc.reset_peak()
+		hac = HAC(trace=0, linkage=linkage)
+		hac.clusterize(object_names, simmatrix, nbclusters=nbclusters)
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		hac.sim_matrix = None
+		results["memmap"] = hac
+		sys.stdout.write("memmap\tfichier : %.1f Mo, mémoire hors fichier : %.1f Mo\tpic clustering hors fichier : %.1f Mo\tlecture : %.2f s\tclustering : %.2f s\n" % (simmatrix.data.nbytes / 2**20, memory / 2**20, peak / 2**20, read_time, time.time() - start))
+		del simmatrix
+	for name in results:
+		if name == "decimal":
+			continue
+		sys.stdout.write("%s\t%s\n" % (name, compare_clusterings(results["decimal"], results[name])))
+
 usage = """Implementation du clustering ascendant agglomeratif (HAC)
-		   de type single-link ou complete-link
+		   de type single-link, complete-link, average-link ou Ward
 		   """+sys.argv[0]+""" [options] THESAURUS_FILE
 			  
 		   Convertit le thesaurus fourni en matrice de similarité et calcule le clustering
@@ -218,26 +677,81 @@ usage = """Implementation du clustering ascendant agglomeratif (HAC)
 parser = argparse.ArgumentParser(usage=usage)
 parser.add_argument('thesaurus_file', help = 'fichier thesaurus', default=None)
 parser.add_argument('-n', "--nbclusters", type=int, default=1, help='Nb (minimal) de clusters voulu. Default=1')
+parser.add_argument('-l', "--linkage", choices=LINKAGES, default="single", help='Critère de similarité entre clusters : single-link, complete-link, average-link ou Ward. Default=single')
+parser.add_argument('-d', "--dtype", choices=sorted(DTYPES), default="float64", help='Type de la matrice de similarité. Default=float64')
+parser.add_argument('-g', "--graph", action="store_true", help='Single-link uniquement : clustering par arbre couvrant de similarité maximale sur le graphe creux du thesaurus, sans matrice n x n. Default=False')
+parser.add_argument('-m', "--memmap", default=None, help='Stocke la matrice de similarité en demi-matrice condensée dans le fichier MEMMAP, projeté en mémoire, pour les thesaurus trop gros pour la RAM (float32 ou float64 ; le fichier est modifié par le clustering). Default=None')
+parser.add_argument("--cuts", default=None, help='Coupe aussi le dendrogramme en chacun de ces nbs de clusters, ex. "2,5,10-20", sans refaire le clustering. Default=None')
+parser.add_argument("--thresholds", default=None, help='Coupe aussi le dendrogramme à chacun de ces seuils de similarité, ex. "0.5,0.2". Default=None')
+parser.add_argument("--export", default=None, help='Ecrit dans EXPORT le numéro de cluster de chaque objet pour chaque coupe (-n, --cuts et --thresholds), au format tabulé. Default=None')
+parser.add_argument("--verify", action="store_true", help='Refait le clustering avec une matrice Decimal (calcul exact) et vérifie que le résultat est le même. Default=False')
+parser.add_argument("--generate", type=int, default=0, help='Ecrit dans THESAURUS_FILE (qui ne doit pas exister) un thesaurus aléatoire de GENERATE mots, puis s\'arrête. Default=0')
+parser.add_argument("--benchmark", action="store_true", help='Compare mémoire et temps de calcul des différents types de matrice sur THESAURUS_FILE, puis s\'arrête. Default=False')
 parser.add_argument('-t', "--trace", type=int, default=0, help='entier 0, 1 ou 2 : Déclenche diverses traces pendant le déroulement de l\'algo. Default=0')
 args = parser.parse_args()
 
+if args.generate:
+	# mode 'x' : on n'écrase jamais un thesaurus existant
+	try:
+		stream = open(args.thesaurus_file, 'x')
+	except FileExistsError:
+		parser.error("--generate : le fichier %s existe déjà, il ne sera pas écrasé" % args.thesaurus_file)
+	with stream:
+		generate_thesaurus(stream, args.generate)
+	exit(0)
+
+if args.graph and args.linkage != "single":
+	parser.error("--graph n'est possible qu'en single-link")
+
+if args.memmap and (args.graph or args.dtype == "decimal"):
+	parser.error("--memmap n'est possible qu'avec une matrice float32 ou float64")
+
+if args.benchmark:
+	benchmark(args.thesaurus_file, args.nbclusters, args.linkage)
+	exit(0)
 
 sys.stderr.write("Ouverture thesaurus...\n")
 thesaurus_stream = open(args.thesaurus_file)
 
 sys.stderr.write("Lecture thesaurus...\n")
-(object_names, simmatrix) = thesaurus2simmatrix(thesaurus_stream)
+if args.graph:
+	(object_names, graph) = thesaurus2graph(thesaurus_stream, DTYPES[args.dtype])
+elif args.memmap:
+	(object_names, simmatrix) = thesaurus2condensed(thesaurus_stream, args.memmap, DTYPES[args.dtype])
+else:
+	(object_names, simmatrix) = thesaurus2simmatrix(thesaurus_stream, DTYPES[args.dtype])
 
 sys.stderr.write("Nb d'objets a clusteriser : " + str(len(object_names)) + "\n")
 
-hac = HAC(trace=args.trace)
+hac = HAC(trace=args.trace, linkage=args.linkage)
 for i in hac.clusters :
 	print(i)
 # A DECOMMENTER une fois l'implementation faite
-hac.clusterize(object_names, simmatrix, nbclusters=args.nbclusters)
+if args.graph:
+	hac.clusterize_graph(object_names, graph, nbclusters=args.nbclusters)
+else:
+	hac.clusterize(object_names, simmatrix, nbclusters=args.nbclusters)
 
 print("\nRésultat clustering hiérarchique en %d clusters:\n" % args.nbclusters)
 hac.dump(sys.stdout)
 
+cuts = [ ("n=%d" % args.nbclusters, hac.clusters) ]
+if args.cuts:
+	cuts += [ ("n=%d" % k, hac.cut(k)) for k in parse_cuts(args.cuts) ]
+if args.thresholds:
+	cuts += [ ("sim>=%s" % threshold, hac.cut_at(threshold)) for threshold in parse_cuts(args.thresholds, float) ]
+if args.export:
+	export_cuts(open(args.export, 'w'), hac, cuts)
+else:
+	for (name, clusters) in cuts[1:]:
+		print("\nCoupe %s : %d clusters\n" % (name, len(clusters)))
+		hac.dump(sys.stdout, clusters)
+
+if args.verify:
+	(object_names, exact_matrix) = thesaurus2simmatrix(open(args.thesaurus_file), Decimal)
+	exact = HAC(trace=0, linkage=args.linkage)
+	exact.clusterize(object_names, exact_matrix, nbclusters=args.nbclusters)
+	sys.stderr.write("Vérification : " + compare_clusterings(exact, hac) + "\n")
+
 if hac.trace:
 	sys.stderr.write( "\nDétail des fusions:\n" + '\n'.join([str(x) for x in hac.clusters]) + "\n")
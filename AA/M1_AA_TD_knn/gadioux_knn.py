@@ -1,13 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: iso-8859-1 -*-
 
-import sys, re, argparse
+import os, sys, re, argparse, zlib, tracemalloc
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib
 from math import *
 from collections import defaultdict
+from array import array
+from types import SimpleNamespace
+from multiprocessing import Pool
+import numpy as np
 
 
 # du fait d'erreurs de calcul, on se retrouve parfois avec des distances négatives
@@ -15,12 +19,36 @@ from collections import defaultdict
 MINDIST =  1e-18
 
 
+class Indice :
+	"""
+	Classe servant à faire un lien entre des mots et leur index.
+	"""
+	def __init__(self):
+		self.words_to_ind = {}
+		self.ind_to_words = []
+	
+	def size_of(self):
+		return len(self.ind_to_words)
+
+	def add_words(self, word):
+		if word not in self.words_to_ind :
+			self.words_to_ind[word] = len(self.ind_to_words)
+			self.ind_to_words.append(word)
+
+	def get_indice(self, word):
+		if word not in self.words_to_ind :
+			self.add_words(word)
+		return self.words_to_ind[word]
+
+
 class Example:
 	"""
 	Un exemple : 
 	vector = représentation vectorielle (Ovector) d'un objet
 	gold_class = la classe gold pour cet objet
 	"""
+	__slots__ = ("gold_class", "example_number", "vector")
+
 	def __init__(self, example_number, gold_class):
 		self.gold_class = gold_class
 		self.example_number = example_number
@@ -29,28 +57,55 @@ class Example:
 	def add_feat(self, featname, val):
 		self.vector.add_feat(featname, val)
 
+	def add_feats(self, featnames, vals):
+		self.vector.add_feats(featnames, vals)
+
 
 class Ovector:
 	"""
 	Un vecteur représentant un objet
 
 	membres
-	- f= simple dictionnaire nom_de_trait => valeur
+	- ids = array des ids des traits (dans le vocabulaire partagé Ovector.vocabulary), dans l'ordre d'ajout
+	- vals = array('d') des valeurs de ces traits
 		 Les traits non stockés correspondent à une valeur nulle
 	- norm_square : la norme au carré
 	"""
+	__slots__ = ("ids", "vals", "norm_square")
+
+	# vocabulaire (instance de Indice) partagé par tous les vecteurs : nom de trait <=> id
+	vocabulary = Indice()
+
 	def __init__(self):
-		self.f = {}
+		self.ids = array('i')
+		self.vals = array('d')
 		self.norm_square = 0
 
 	def add_feat(self, featname, val = 0.0):
-		self.f[featname] = val
+		self.ids.append(Ovector.vocabulary.get_indice(featname))
+		self.vals.append(val)
 		self.norm_square += val*val
 
+	def add_feats(self, featnames, vals):
+		""" add_feat pour une liste de traits et la liste de leurs valeurs """
+		get_indice = Ovector.vocabulary.get_indice
+		self.ids.extend([get_indice(featname) for featname in featnames])
+		self.vals.extend(vals)
+		norm_square = self.norm_square
+		for val in vals :
+			norm_square += val*val
+		self.norm_square = norm_square
+
+	@property
+	def f(self):
+		""" dictionnaire nom_de_trait => valeur, construit à la demande """
+		words = Ovector.vocabulary.ind_to_words
+		return { words[feat] : val for feat, val in zip(self.ids, self.vals) }
 
 	def prettyprint(self):
-		for feat in sorted(self.f, lambda x,y: cmp( self.f[y], self.f[x] ) or cmp(x,y)):
-			print (feat + "	" + str(self.f[feat]))
+		f = self.f
+		for feat in sorted(f, key = lambda x : (-f[x], x)):
+			print (feat + "	" + str(f[feat]))
 
 	def distance_to_vector(self, other_vector):
 		""" distance euclidienne entre self et other_vector, en ayant precalculé les normes au carre de chacun """
@@ -61,10 +116,11 @@ class Ovector:
 
 	def dot_product(self, other_vector):
 		""" rend le produit scalaire de self et other_vector """
+		other = dict(zip(other_vector.ids, other_vector.vals))
 		dot = 0
-		for feat in self.f :
-			if feat in other_vector.f :
-				dot += self.f[feat]*other_vector.f[feat]
+		for feat, val in zip(self.ids, self.vals) :
+			if feat in other :
+				dot += val*other[feat]
 		return dot
 
 	def cosinus(self, other_vector):
@@ -72,6 +128,54 @@ class Ovector:
 		return self.dot_product(other_vector) / sqrt(self.norm_square * other_vector.norm_square)
 
 
+def top_k(scores, k, largest = True):
+	"""
+	Selection des k meilleurs scores de chaque ligne de scores (vecteur ou matrice numpy),
+	sans trier toute la ligne : argpartition, puis tri des k survivants seulement.
+	Retourne une matrice (nb_lignes, k) d'indices, tries du meilleur au moins bon score ;
+	a score egal, l'indice le plus petit passe devant (meme ordre qu'un sorted() stable).
+	"""
+	keys = np.atleast_2d(-scores if largest else scores)
+	n_rows, n = keys.shape
+	k = min(k, n)
+	if k < n :
+		selected = np.argpartition(keys, k-1, axis = 1)[:, :k]
+		# valeur du k-ieme : les egalites a cette valeur ne sont pas departagees par argpartition
+		kth = np.take_along_axis(keys, selected, axis = 1).max(axis = 1)
+		n_better = (keys < kth[:, None]).sum(axis = 1)
+		n_ties = (keys == kth[:, None]).sum(axis = 1)
+		for row in np.flatnonzero(n_ties > k - n_better) :
+			better = np.flatnonzero(keys[row] < kth[row])
+			ties = np.flatnonzero(keys[row] == kth[row])[:k - n_better[row]]
+			selected[row] = np.concatenate((better, ties))
+	else :
+		selected = np.tile(np.arange(n), (n_rows, 1))
+	# tri des k survivants : par score, puis par indice
+	order = np.lexsort((selected, np.take_along_axis(keys, selected, axis = 1)), axis = -1)
+	return np.take_along_axis(selected, order, axis = 1)
+
+
+def vote_all_k(neighbor_classes, neighbor_weights, n_classes):
+	"""
+	Vote des voisins pour toutes les valeurs de k de 1 a K, pour tout un lot d'exemples de test.
+	neighbor_classes : matrice (nb_tests, K) des ids de classe des voisins, du plus proche au plus lointain
+	neighbor_weights : matrice (nb_tests, K) des poids de vote de ces voisins
+	Les ids de classe suivent l'ordre alphabetique des classes : a total egal, argmax garde le premier,
+	ce qui reproduit le departage alphabetique.
+	Retourne la matrice (nb_tests, K) des ids de classe predits, la colonne i correspondant a k = i+1.
+	"""
+	n_tests, K = neighbor_classes.shape
+	rows = np.arange(n_tests)
+	# -inf pour les classes n'ayant encore recu aucun voisin : elles ne peuvent pas gagner
+	totals = np.full((n_tests, n_classes), -np.inf)
+	predictions = np.empty((n_tests, K), dtype = int)
+	for i in range(K):
+		current = totals[rows, neighbor_classes[:, i]]
+		totals[rows, neighbor_classes[:, i]] = np.where(np.isneginf(current), 0, current) + neighbor_weights[:, i]
+		predictions[:, i] = totals.argmax(axis = 1)
+	return predictions
+
+
 class KNN:
 	"""
 	K-NN pour la classification de documents (multiclasse)
@@ -84,8 +188,10 @@ class KNN:
 
 	classes = liste des classes (telles que recensées dans les exemples)
 
+	index = index inversé : id de trait => (ids des exemples ayant ce trait, valeurs du trait dans ces exemples)
+
 	"""
-	def __init__(self, examples, K = 1, weight_neighbors = None, use_cosinus = False, trace = False):
+	def __init__(self, examples, K = 1, weight_neighbors = None, use_cosinus = False, trace = False, lsh = None):
 		""" 
 		simple positionnement des membres et recensement des classes connues
 		"""
@@ -99,8 +205,18 @@ class KNN:
 		# booleen : pour utiliser plutot la similarité cosinus
 		self.use_cosinus = use_cosinus
 
+		# instance de LSH pour une recherche approchée des voisins (cosinus uniquement), ou None
+		self.lsh = lsh
+
 		self.trace = trace
-		
+
+		# les classes, par ordre alphabetique (l'id d'une classe est son rang), et l'id de classe de chaque exemple
+		self.classes = np.array(sorted(set(example.gold_class for example in examples)))
+		self.class_ids = np.searchsorted(self.classes, [example.gold_class for example in examples])
+
+		# index inversé et normes au carré des exemples, construits une seule fois, a la premiere recherche de voisins
+		self.index = None
+		self.norm_squares = None
 
 	def weigth(self, x) :
 		if not self.weight_neighbors :
@@ -110,6 +226,52 @@ class KNN:
 		else :
 			return 1/x
 
+	def nearest(self, ovector):
+		"""
+		Retourne les ids des self.K plus proches voisins de ovector, du plus proche au plus lointain,
+		et leur similarité cosinus ou leur distance (selon self.use_cosinus)
+		"""
+		if self.index is None :
+			self.index = build_inverted_index(self.examples)
+			self.norm_squares = np.array([example.vector.norm_square for example in self.examples])
+
+		#Dot products with every example, through the inverted index :
+		#only the examples sharing at least one feature with ovector are touched
+		dots = np.zeros(len(self.examples))
+		touched = []
+		for feat, val in zip(ovector.ids, ovector.vals) :
+			if feat in self.index :
+				ids, values = self.index[feat]
+				dots[ids] += values * val
+				touched.append(ids)
+
+		if self.use_cosinus :
+			candidates = np.arange(0)
+			if self.lsh is not None :
+				# recherche approchée : on ne garde que les exemples partageant un seau LSH avec ovector
+				candidates = self.lsh.candidates(ovector)
+			if candidates.size < self.K :
+				candidates = np.unique(np.concatenate(touched)) if touched else np.arange(0)
+			if candidates.size < self.K :
+				# pas assez de documents en commun : les autres ont un cosinus nul
+				candidates = np.arange(len(self.examples))
+			scores = dots[candidates] / np.sqrt(self.norm_squares[candidates] * ovector.norm_square)
+		else :
+			candidates = np.arange(len(self.examples))
+			scores = np.sqrt(np.maximum(self.norm_squares + ovector.norm_square - 2 * dots, MINDIST))
+
+		#Select the K nearest neighbors (candidates are sorted, so ties are still broken by example rank)
+		top = top_k(scores, self.K, largest = self.use_cosinus)[0]
+		return candidates[top], scores[top]
+
+	def neighbors(self, ovector):
+		"""
+		Retourne les ids de classe et les poids de vote des self.K plus proches voisins de ovector,
+		du plus proche au plus lointain
+		"""
+		ids, scores = self.nearest(ovector)
+		return self.class_ids[ids], [self.weigth(x) for x in scores]
+
 	def classify(self, ovector):
 		"""
 		Réalise la prédiction du classifieur K-NN pour le ovector
@@ -119,33 +281,9 @@ class KNN:
 		retourne un vecteur des classes assignées de longueur K : 
 		la classe à la i-eme  position est la classe assignée par l'algo K-NN, avec K = i
 		"""
-		#Select the classifying function
-		if self.use_cosinus :
-			prox = Ovector.cosinus
-		else :
-			prox = Ovector.distance_to_vector
-		
-		#Classify
-		neighbors = []
-		for example in self.examples :
-			neighbors.append((example.gold_class, prox(example.vector, ovector)))
-
-		#Sort neighbors
-		best = sorted(neighbors, key = lambda x : x[1], reverse = self.use_cosinus)
-
-		#Extracts nearests neighbors
-		result = []
-		i_class = defaultdict(int)
-		for i in range(self.K):
-			i_class[best[i][0]] += self.weigth(best[i][1])
-			top_ones = 0 # top_ones is for preventing list out of range while sorting alphabeticals.
-			classes = sorted(i_class.items(), key = lambda x : x[1], reverse = True)
-			alpha = set()
-			while top_ones < len(classes) and classes[top_ones][1] == classes[0][1] :
-				alpha.add(classes[top_ones][0])
-				top_ones += 1
-			result.append(sorted(alpha)[0])
-		return result
+		neighbor_classes, neighbor_weights = self.neighbors(ovector)
+		predictions = vote_all_k(neighbor_classes[None, :], np.array([neighbor_weights]), self.classes.size)
+		return list(self.classes[predictions[0]])
 
 
 	def evaluate_on_test_set(self, test_examples):
@@ -153,15 +291,124 @@ class KNN:
 		pour les valeurs de k allant de 1 à self.K
 		Retourne une liste d'accuracy (pour les valeurs de k à self.K)
 		"""
-		results = [0 for i in range(self.K)]
-		for example in test_examples :
-			class_example = self.classify(example.vector)
-			result_example = [1 if example.gold_class == class_i else 0 for class_i in class_example]
-			results = [x + y for x, y in zip(results, result_example)]
-		return [acc / len(test_examples) for acc in results]
+		return self.evaluate_nearest([self.nearest(example.vector) for example in test_examples], test_examples)
+
+	def evaluate_nearest(self, nearest, test_examples):
+		""" Evaluation (accuracy) pour les valeurs de k allant de 1 à self.K,
+		a partir des plus proches voisins (ids, scores) de chaque exemple de test, tels que rendus par nearest
+		(ils ne dependent pas de la ponderation : on peut les partager entre classifieurs ponderes ou non)
+		"""
+		neighbor_classes = np.array([self.class_ids[ids] for ids, scores in nearest])
+		neighbor_weights = np.array([[self.weigth(x) for x in scores] for ids, scores in nearest])
+		predictions = vote_all_k(neighbor_classes, neighbor_weights, self.classes.size)
+		gold = np.array([example.gold_class for example in test_examples])
+		return list((self.classes[predictions] == gold[:, None]).mean(axis = 0))
 		
 		
 
+class LSH:
+	"""
+	Index approché pour la similarité cosinus, par projections aléatoires signées (LSH) :
+	dans chaque table, un vecteur est haché en n_bits bits (signe de son produit avec n_bits hyperplans aléatoires).
+
+	membres =
+
+	planes = dictionnaire id de trait => composantes (n_tables * n_bits) des normales aux hyperplans,
+			 tirées au hasard à la première rencontre du trait (graine = seed et crc32 du trait :
+			 le tirage ne dépend pas de l'ordre des requêtes, ni du processus qui les traite)
+
+	buckets = pour chaque table, dictionnaire clé de hachage => ids des exemples
+	"""
+	def __init__(self, examples, n_tables, n_bits, seed = 0):
+		self.n_tables = n_tables
+		self.n_bits = n_bits
+		self.seed = seed
+		self.planes = {}
+		self.buckets = [defaultdict(list) for table in range(n_tables)]
+		for example_id, example in enumerate(examples) :
+			for table, key in enumerate(self.hash(example.vector)) :
+				self.buckets[table][key].append(example_id)
+
+	def hash(self, ovector):
+		""" Liste des clés de hachage de ovector, une par table """
+		projection = np.zeros(self.n_tables * self.n_bits)
+		for feat, val in zip(ovector.ids, ovector.vals) :
+			if feat not in self.planes :
+				featname = Ovector.vocabulary.ind_to_words[feat]
+				rng = np.random.default_rng([self.seed, zlib.crc32(featname.encode())])
+				self.planes[feat] = rng.standard_normal(self.n_tables * self.n_bits)
+			projection += val * self.planes[feat]
+		bits = (projection > 0).reshape(self.n_tables, self.n_bits)
+		return list((bits * (1 << np.arange(self.n_bits))).sum(axis = 1))
+
+	def candidates(self, ovector):
+		""" Ids (triés) des exemples partageant le seau de ovector dans au moins une table """
+		ids = set()
+		for table, key in enumerate(self.hash(ovector)) :
+			ids.update(self.buckets[table].get(key, []))
+		return np.array(sorted(ids), dtype = int)
+
+# Classifieurs (un par mesure) et exemples de test des processus de tuning, cf. init_tuning
+tuning_classifiers = {}
+tuning_tests = []
+
+def init_tuning(training_examples, test_examples, K, lsh, vocabulary):
+	""" Initialisation d'un processus de tuning : un classifieur par mesure (cosinus ou distance) """
+	global tuning_classifiers, tuning_tests
+	Ovector.vocabulary = vocabulary
+	tuning_classifiers = { cos : KNN(training_examples, K = K, use_cosinus = cos, lsh = lsh) for cos in [True, False] }
+	tuning_tests = test_examples
+
+def tuning_nearest(task):
+	""" Plus proches voisins (cf. KNN.nearest) des exemples de test start:stop, pour la mesure cos """
+	cos, start, stop = task
+	return [tuning_classifiers[cos].nearest(example.vector) for example in tuning_tests[start:stop]]
+
+def tune(training_examples, test_examples, K, trace = False, lsh = None, jobs = 1):
+	"""
+	Tuning des hyperparametres : accuracy pour k de 1 a K, pour cos ou dist, avec ou sans ponderation.
+	Les plus proches voisins ne dependent que de la mesure : ils sont calcules une fois par mesure,
+	par morceaux du jeu de test repartis sur jobs processus, puis partages entre les variantes de ponderation.
+	Retourne un DataFrame (une colonne par configuration, une ligne par valeur de k).
+	"""
+	shard = max(1, -(-len(test_examples) // (4 * jobs)))
+	tasks = [(cos, start, start + shard) for cos in [True, False] for start in range(0, len(test_examples), shard)]
+	if jobs > 1 :
+		with Pool(jobs, initializer = init_tuning, initargs = (training_examples, test_examples, K, lsh, Ovector.vocabulary)) as pool :
+			shards = pool.map(tuning_nearest, tasks)
+	else :
+		init_tuning(training_examples, test_examples, K, lsh, Ovector.vocabulary)
+		shards = list(map(tuning_nearest, tasks))
+	nearest = defaultdict(list)
+	for (cos, start, stop), result in zip(tasks, shards) :
+		nearest[cos].extend(result)
+
+	tuner = defaultdict(object)
+	for cos in [True, False] : 
+		for weight in [True, False] :
+			classifier = KNN( examples = training_examples,
+							K = K,
+							weight_neighbors = weight,
+							use_cosinus = cos,
+							trace = trace,
+							lsh = lsh)
+			tuner[("Cosinus" if cos else "Euclide") + " " + ("Pondere" if weight else "Standard")] = classifier.evaluate_nearest(nearest[cos], test_examples)
+	df = pd.DataFrame.from_dict(tuner)
+	df.index = range(1, K+1)
+	return df
+
+def build_inverted_index(examples):
+	""" Construit l'index inversé des exemples :
+	dictionnaire id de trait => (tableau des ids des exemples contenant ce trait, tableau des valeurs correspondantes)
+	"""
+	postings = defaultdict(lambda : ([], []))
+	for example_id, example in enumerate(examples) :
+		for feat, val in zip(example.vector.ids, example.vector.vals) :
+			ids, values = postings[feat]
+			ids.append(example_id)
+			values.append(val)
+	return { feat : (np.array(ids), np.array(values)) for feat, (ids, values) in postings.items() }
+
 def read_examples(infile):
 	""" Lit un fichier d'exemples 
 	et retourne une liste d'instances de Example
@@ -191,6 +438,107 @@ def read_examples(infile):
 
 
 
+def memory_benchmark(infile):
+	"""
+	Compare la mémoire (mesurée par tracemalloc) occupée par les exemples de infile :
+	- ancienne représentation : objets à __dict__, un dictionnaire nom_de_trait => valeur par vecteur
+	- représentation compacte : Example / Ovector à __slots__, ids de traits et valeurs en array
+	"""
+	tracemalloc.start()
+	old = []
+	for line in open(infile) :
+		line = line[0:-1]
+		if line.startswith("EXAMPLE_NB"):
+			cols = line.split('	')
+			old.append(SimpleNamespace(gold_class = cols[3], example_number = cols[1], vector = SimpleNamespace(f = {}, norm_square = 0)))
+		elif line and old:
+			(featname, val) = line.split('	')
+			old[-1].vector.f[featname] = float(val)
+			old[-1].vector.norm_square += float(val)**2
+	old_size = tracemalloc.get_traced_memory()[0]
+	n_feats = sum(len(example.vector.f) for example in old)
+	del old
+	tracemalloc.stop()
+
+	tracemalloc.start()
+	new = read_examples(infile)
+	new_size = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+
+	print("EXAMPLES :", len(new), "\tFEATURES :", n_feats, "\tVOCABULARY :", Ovector.vocabulary.size_of())
+	print("DICT\t: {:.1f} Mo ({:.0f} octets par trait)".format(old_size / 2**20, old_size / n_feats))
+	print("COMPACT\t: {:.1f} Mo ({:.0f} octets par trait, vocabulaire compris)".format(new_size / 2**20, new_size / n_feats))
+
+# tableaux du cache binaire d'un fichier .examples (un fichier .npy par tableau)
+CACHE_ARRAYS = ["vocabulary", "labels", "numbers", "data", "indices", "indptr"]
+
+def compile_examples(infile, cache_dir):
+	""" Compile un fichier d'exemples en cache binaire dans le répertoire cache_dir :
+	vocabulaire (dans l'ordre d'apparition), classes gold, numéros d'exemples,
+	et matrice des traits au format CSR (data / indices / indptr, dans l'ordre du fichier)
+	"""
+	stream = open(infile)
+	vocabulary = {}
+	labels = []
+	numbers = []
+	data = []
+	indices = []
+	indptr = []
+	while True:
+		line = stream.readline()
+		if not line:
+			break
+		line = line[0:-1]
+		if line.startswith("EXAMPLE_NB"):
+			cols = line.split('	')
+			labels.append(cols[3])
+			numbers.append(cols[1])
+			indptr.append(len(data))
+		elif line and indptr:
+			(featname, val) = line.split('	')
+			if featname not in vocabulary :
+				vocabulary[featname] = len(vocabulary)
+			indices.append(vocabulary[featname])
+			data.append(float(val))
+	indptr.append(len(data))
+
+	os.makedirs(cache_dir, exist_ok = True)
+	arrays = { "vocabulary" : np.array(list(vocabulary), dtype = str),
+			   "labels" : np.array(labels, dtype = str),
+			   "numbers" : np.array(numbers, dtype = str),
+			   "data" : np.array(data, dtype = np.float64),
+			   "indices" : np.array(indices, dtype = np.int32),
+			   "indptr" : np.array(indptr, dtype = np.int64) }
+	# indptr est écrit en dernier : sa date sert de date du cache
+	for name in CACHE_ARRAYS :
+		np.save(os.path.join(cache_dir, name + ".npy"), arrays[name])
+
+def load_examples_cache(infile):
+	""" Charge (en mémoire projetée) le cache binaire du fichier d'exemples infile,
+	en le (re)compilant s'il n'existe pas ou si infile est plus récent que lui.
+	Retourne un dictionnaire nom => tableau (cf. CACHE_ARRAYS)
+	"""
+	cache_dir = infile + ".cache"
+	stamp = os.path.join(cache_dir, "indptr.npy")
+	if not os.path.exists(stamp) or os.path.getmtime(infile) > os.path.getmtime(stamp) :
+		compile_examples(infile, cache_dir)
+	return { name : np.load(os.path.join(cache_dir, name + ".npy"), mmap_mode = "r") for name in CACHE_ARRAYS }
+
+def read_examples_cached(infile):
+	""" Equivalent de read_examples passant par le cache binaire de infile (cf. load_examples_cache) """
+	cache = load_examples_cache(infile)
+	vocabulary = cache["vocabulary"].tolist()
+	indices = cache["indices"].tolist()
+	data = cache["data"].tolist()
+	indptr = cache["indptr"].tolist()
+	examples = []
+	for i, (example_number, gold_class) in enumerate(zip(cache["numbers"].tolist(), cache["labels"].tolist())) :
+		example = Example(example_number, gold_class)
+		example.add_feats([vocabulary[j] for j in indices[indptr[i]:indptr[i+1]]], data[indptr[i]:indptr[i+1]])
+		examples.append(example)
+	return examples
+
+
 usage = """ CLASSIFIEUR de DOCUMENTS, de type K-NN
 
   """+sys.argv[0]+""" [options] EXAMPLES_FILE TEST_FILE
@@ -199,67 +547,82 @@ usage = """ CLASSIFIEUR de DOCUMENTS, de type K-NN
 
 """
 
-parser = argparse.ArgumentParser(usage = usage)
-parser.add_argument('examples_file', default = None,
-					help = 'Exemples utilisés comme voisins pour la prédiction KNN (au format .examples)')
+def main():
+	""" Ligne de commande : classification KNN des exemples de test, ou tuning des hyperparametres """
+	parser = argparse.ArgumentParser(usage = usage)
+	parser.add_argument('examples_file', default = None,
+						help = 'Exemples utilisés comme voisins pour la prédiction KNN (au format .examples)')
 
-parser.add_argument('test_file', default = None,
-					help = 'Exemples de test (au format .examples)')
+	parser.add_argument('test_file', default = None,
+						help = 'Exemples de test (au format .examples)')
 
-parser.add_argument('-k', "--k", default = 1, type = int,
-					help = 'Hyperparametre K : le nombre max de voisins a considerer pour la classification (toutes les valeurs de 1 a k seront testees). Default = 1')
+	parser.add_argument('-k', "--k", default = 1, type = int,
+						help = 'Hyperparametre K : le nombre max de voisins a considerer pour la classification (toutes les valeurs de 1 a k seront testees). Default = 1')
 
-parser.add_argument('-v', "--trace", action = "store_true",
-					help = "A utiliser pour declencher un mode verbeux. Default = False")
+	parser.add_argument('-v', "--trace", action = "store_true",
+						help = "A utiliser pour declencher un mode verbeux. Default = False")
 
-parser.add_argument('-w', "--weight_neighbors", action = "store_true",
-					help = "Ponderation des voisins : si cosinus: ponderation par le cosinus, si distance, ponderation par l'inverse de la distance. Defaut = None")
+	parser.add_argument('-w', "--weight_neighbors", action = "store_true",
+						help = "Ponderation des voisins : si cosinus: ponderation par le cosinus, si distance, ponderation par l'inverse de la distance. Defaut = None")
 
-parser.add_argument('-c', "--use_cosinus", action = "store_true",
-					help = "A utiliser pour passer a une mesure de similarite cosinus, au lieu d'une distance euclidienne. Default = False")
+	parser.add_argument('-c', "--use_cosinus", action = "store_true",
+						help = "A utiliser pour passer a une mesure de similarite cosinus, au lieu d'une distance euclidienne. Default = False")
 
-parser.add_argument('-t', "--tune", action = "store_true", default = "",
-					help = 'A utiliser pour declencher le tuning des hyperparametres: cos ou dist, avec ou sans ponderation, et figure des performances en fonction de k. Default = False')
+	parser.add_argument('-l', "--lsh_tables", default = 0, type = int,
+						help = "Recherche approchee des voisins (cosinus uniquement) par LSH avec LSH_TABLES tables. Default = 0 (recherche exacte)")
 
-parser.add_argument('-f', "--figure_file", default = "graphique.pdf",
-					help = 'Pour le mode "tune": Base de nom de fichier pour graphique precision en fonction de K. Default = "graphique.pdf".')
+	parser.add_argument("--lsh_bits", default = 12, type = int,
+						help = "Nombre de bits (hyperplans) par table LSH. Default = 12")
 
-args = parser.parse_args()
+	parser.add_argument('-t', "--tune", action = "store_true", default = "",
+						help = 'A utiliser pour declencher le tuning des hyperparametres: cos ou dist, avec ou sans ponderation, et figure des performances en fonction de k. Default = False')
 
-#------------------------------------------------------------
-# Chargement des exemples d'apprentissage du classifieur KNN
-training_examples = read_examples(args.examples_file)
-# Chargement des exemples de test
-test_examples = read_examples(args.test_file)
+	parser.add_argument('-j', "--jobs", default = 1, type = int,
+						help = 'Pour le mode "tune": nombre de processus pour le calcul des plus proches voisins. Default = 1')
 
-if args.tune :
-	tuner = defaultdict(object)
-	for cos in [True, False] : 
-		for weight in [True, False] :
-			classifier = KNN( examples = training_examples,
-							K = args.k,
-							weight_neighbors = weight,
-							use_cosinus = cos,
-							trace = args.trace)
-			tuner[("Cosinus" if cos else "Euclide") + " " + ("Pondere" if weight else "Standard")] = classifier.evaluate_on_test_set(test_examples)
-	df = pd.DataFrame.from_dict(tuner)
-	df.index = range(1,args.k+1)
-	print(df)
-	ax = sns.lineplot(data = df)
-	plt.show()
-else :
+	parser.add_argument("--cache", action = "store_true",
+						help = "Lit les exemples via un cache binaire (FICHIER.cache/), compile au premier usage et recompile si le fichier est plus recent. Default = False")
+
+	parser.add_argument("--memory_benchmark", action = "store_true",
+						help = "Compare la memoire occupee par les exemples d'apprentissage avec l'ancienne representation (dictionnaires) et la representation compacte, puis s'arrete. Default = False")
 
-	myclassifier = KNN( examples = training_examples,
-						K = args.k,
-						weight_neighbors = args.weight_neighbors,
-						use_cosinus = args.use_cosinus,
-						trace = args.trace)
+	parser.add_argument('-f', "--figure_file", default = "graphique.pdf",
+						help = 'Pour le mode "tune": Base de nom de fichier pour graphique precision en fonction de K. Default = "graphique.pdf".')
 
-	# classification et evaluation sur les exemples de test
-	accuracies = myclassifier.evaluate_on_test_set(test_examples)
-	for i in range(len(accuracies)):
-		print("ACCURACY FOR K =", i+1, " : ","{:.2%}".format(accuracies[i]),
-				"(weight =", args.weight_neighbors, "dist_or_cos =", "cos)" if args.use_cosinus else "dist)" )
+	args = parser.parse_args()
 
+	#------------------------------------------------------------
+	if args.memory_benchmark :
+		memory_benchmark(args.examples_file)
+		return
 
+	# Chargement des exemples d'apprentissage du classifieur KNN
+	training_examples = read_examples_cached(args.examples_file) if args.cache else read_examples(args.examples_file)
+	# Chargement des exemples de test
+	test_examples = read_examples_cached(args.test_file) if args.cache else read_examples(args.test_file)
+	# Index LSH pour la recherche approchee
+	lsh = LSH(training_examples, args.lsh_tables, args.lsh_bits) if args.lsh_tables > 0 else None
 
+	if args.tune :
+		df = tune(training_examples, test_examples, args.k, args.trace, lsh, args.jobs)
+		print(df)
+		ax = sns.lineplot(data = df)
+		plt.show()
+	else :
+
+		myclassifier = KNN( examples = training_examples,
+							K = args.k,
+							weight_neighbors = args.weight_neighbors,
+							use_cosinus = args.use_cosinus,
+							trace = args.trace,
+							lsh = lsh)
+
+		# classification et evaluation sur les exemples de test
+		accuracies = myclassifier.evaluate_on_test_set(test_examples)
+		for i in range(len(accuracies)):
+			print("ACCURACY FOR K =", i+1, " : ","{:.2%}".format(accuracies[i]),
+					"(weight =", args.weight_neighbors, "dist_or_cos =", "cos)" if args.use_cosinus else "dist)" )
+
+# garde indispensable pour --tune -j N : avec les methodes de demarrage spawn et forkserver, chaque processus du Pool reimporte ce script
+if __name__ == "__main__":
+	main()
@@ -1,10 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: iso-8859-1 -*-
 
-import sys, re,  argparse
+import os, sys, re,  argparse, resource, time, json, queue, threading
 from math import *
-from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
 import numpy as np
+from scipy import sparse
 
 # du fait d'erreurs de calcul, on se retrouve parfois avec des distances négatives
 # on prend ici une valeur minimale de distance, positive (pour pouvoir prendre la racine) et non nulle (pour pouvoir prendre l'inverse)
@@ -95,7 +97,96 @@ def read_examples(infile, indice):
 		examples.append(example)
 	return examples
 
-def give_me_the_matrix(example_list, indice):
+# tableaux du cache binaire d'un fichier .examples (un fichier .npy par tableau)
+CACHE_ARRAYS = ["vocabulary", "labels", "numbers", "data", "indices", "indptr"]
+
+def compile_examples(infile, cache_dir):
+	""" Compile un fichier d'exemples en cache binaire dans le répertoire cache_dir :
+	vocabulaire (dans l'ordre d'apparition), classes gold, numéros d'exemples,
+	et matrice des traits au format CSR (data / indices / indptr, dans l'ordre du fichier)
+	"""
+	stream = open(infile)
+	vocabulary = {}
+	labels = []
+	numbers = []
+	data = []
+	indices = []
+	indptr = []
+	while True:
+		line = stream.readline()
+		if not line:
+			break
+		line = line[0:-1]
+		if line.startswith("EXAMPLE_NB"):
+			cols = line.split('	')
+			labels.append(cols[3])
+			numbers.append(cols[1])
+			indptr.append(len(data))
+		elif line and indptr:
+			(featname, val) = line.split('	')
+			if featname not in vocabulary :
+				vocabulary[featname] = len(vocabulary)
+			indices.append(vocabulary[featname])
+			data.append(float(val))
+	indptr.append(len(data))
+
+	os.makedirs(cache_dir, exist_ok = True)
+	arrays = { "vocabulary" : np.array(list(vocabulary), dtype = str),
+			   "labels" : np.array(labels, dtype = str),
+			   "numbers" : np.array(numbers, dtype = str),
+			   "data" : np.array(data, dtype = np.float64),
+			   "indices" : np.array(indices, dtype = np.int32),
+			   "indptr" : np.array(indptr, dtype = np.int64) }
+	# indptr est écrit en dernier : sa date sert de date du cache
+	for name in CACHE_ARRAYS :
+		np.save(os.path.join(cache_dir, name + ".npy"), arrays[name])
+
+def load_examples_cache(infile):
+	""" Charge (en mémoire projetée) le cache binaire du fichier d'exemples infile,
+	en le (re)compilant s'il n'existe pas ou si infile est plus récent que lui.
+	Retourne un dictionnaire nom => tableau (cf. CACHE_ARRAYS)
+	"""
+	cache_dir = infile + ".cache"
+	stamp = os.path.join(cache_dir, "indptr.npy")
+	if not os.path.exists(stamp) or os.path.getmtime(infile) > os.path.getmtime(stamp) :
+		compile_examples(infile, cache_dir)
+	return { name : np.load(os.path.join(cache_dir, name + ".npy"), mmap_mode = "r") for name in CACHE_ARRAYS }
+
+def read_examples_cached(infile, indice):
+	""" Equivalent de read_examples passant par le cache binaire de infile (cf. load_examples_cache) :
+	les traits sont chargés dans indice, et on retourne les tableaux CSR (colonnes = ids de indice)
+	et la liste des classes gold
+	"""
+	cache = load_examples_cache(infile)
+	columns = np.array([indice.get_indice(word) for word in cache["vocabulary"].tolist()], dtype = np.int32)
+	return cache["data"], columns[cache["indices"]], cache["indptr"], cache["labels"].tolist()
+
+def give_me_the_cached_matrix(cached, indice, use_sparse = False):
+	""" Equivalent de give_me_the_matrix pour les tableaux rendus par read_examples_cached """
+	data, indices, indptr, Y_vector = cached
+	X_matrix = sparse.csr_matrix((data, indices, indptr), shape = (indptr.size - 1, indice.size_of()))
+	if not use_sparse :
+		X_matrix = X_matrix.toarray()
+	return X_matrix, Y_vector
+
+def load_matrices(infiles, indice, use_cache = False, use_sparse = False):
+	""" Charge les fichiers d'exemples infiles (en chargeant leurs traits dans indice),
+	et retourne la liste des (matrice, classes gold) correspondantes
+	"""
+	if use_cache :
+		loaded = [read_examples_cached(infile, indice) for infile in infiles]
+		return [give_me_the_cached_matrix(cached, indice, use_sparse) for cached in loaded]
+	loaded = [read_examples(infile, indice) for infile in infiles]
+	return [give_me_the_matrix(example_list, indice, use_sparse) for example_list in loaded]
+
+def give_me_the_matrix(example_list, indice, use_sparse = False):
+	"""
+	Construit la matrice des exemples (une ligne par exemple, une colonne par trait de indice)
+	et le vecteur des classes gold.
+	Si use_sparse, la matrice est une scipy.sparse.csr_matrix : seules les valeurs non nulles sont stockees.
+	"""
+	if use_sparse :
+		return give_me_the_sparse_matrix(example_list, indice)
 	X_matrix = np.zeros((len(example_list), indice.size_of()))
 	Y_vector = []
 	i = 0
@@ -106,50 +197,429 @@ def give_me_the_matrix(example_list, indice):
 		i += 1
 	return X_matrix, Y_vector
 
+def give_me_the_sparse_matrix(example_list, indice):
+	""" Version CSR de give_me_the_matrix : on remplit directement indptr / indices / data """
+	indptr = [0]
+	indices = []
+	data = []
+	Y_vector = []
+	for example in example_list :
+		Y_vector.append(example.gold_class)
+		for feat in example.vector.f :
+			indices.append(indice.get_indice(feat))
+			data.append(example.vector.f[feat])
+		indptr.append(len(indices))
+	X_matrix = sparse.csr_matrix((np.array(data, dtype = float), np.array(indices, dtype = np.int32), np.array(indptr, dtype = np.int32)),
+								shape = (len(example_list), indice.size_of()))
+	return X_matrix, Y_vector
+
 def return_norm(matrix):
+	if sparse.issparse(matrix) :
+		return np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis = 1)).ravel())
 	return np.apply_along_axis(np.linalg.norm,1, matrix)
 
 def normalize_matrix(matrix, norm_of):
+	if sparse.issparse(matrix) :
+		# multiplication a gauche par la diagonale des inverses des normes : reste creux
+		return sparse.diags(1 / norm_of).dot(matrix).tocsr()
 	return matrix/norm_of[:,None]
 
+def top_k(scores, k, largest = True):
+	"""
+	Selection des k meilleurs scores de chaque ligne de scores (vecteur ou matrice numpy),
+	sans trier toute la ligne : argpartition, puis tri des k survivants seulement.
+	Retourne une matrice (nb_lignes, k) d'indices, tries du meilleur au moins bon score ;
+	a score egal, l'indice le plus petit passe devant (meme ordre qu'un sorted() stable).
+	"""
+	keys = np.atleast_2d(-scores if largest else scores)
+	n_rows, n = keys.shape
+	k = min(k, n)
+	if k < n :
+		selected = np.argpartition(keys, k-1, axis = 1)[:, :k]
+		# valeur du k-ieme : les egalites a cette valeur ne sont pas departagees par argpartition
+		kth = np.take_along_axis(keys, selected, axis = 1).max(axis = 1)
+		n_better = (keys < kth[:, None]).sum(axis = 1)
+		n_ties = (keys == kth[:, None]).sum(axis = 1)
+		for row in np.flatnonzero(n_ties > k - n_better) :
+			better = np.flatnonzero(keys[row] < kth[row])
+			ties = np.flatnonzero(keys[row] == kth[row])[:k - n_better[row]]
+			selected[row] = np.concatenate((better, ties))
+	else :
+		selected = np.tile(np.arange(n), (n_rows, 1))
+	# tri des k survivants : par score, puis par indice
+	order = np.lexsort((selected, np.take_along_axis(keys, selected, axis = 1)), axis = -1)
+	return np.take_along_axis(selected, order, axis = 1)
+
 def create_cos_matrix(X_train, X_test):
+	"""
+	Matrice des cosinus : lignes = exemples de test, colonnes = exemples d'apprentissage.
+	Avec des matrices creuses, le produit est un produit creux x creux, et le resultat reste creux.
+	"""
 	norm_train = return_norm(X_train)
 	norm_test = return_norm(X_test)
+	if sparse.issparse(X_train) :
+		return normalize_matrix(X_test, norm_test ).dot(normalize_matrix(X_train, norm_train).transpose()).tocsr()
 	classed = np.dot( normalize_matrix(X_test, norm_test ), normalize_matrix(X_train, norm_train).transpose())
 	return classed
 
+def peak_memory():
+	""" Pic de memoire residente du processus, en Mo (ru_maxrss est en ko sous Linux) """
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def vote_all_k(neighbor_classes, neighbor_weights, n_classes):
+	"""
+	Vote des voisins pour toutes les valeurs de k de 1 a K, pour tout un lot d'exemples de test.
+	neighbor_classes : matrice (nb_tests, K) des ids de classe des voisins, du plus proche au plus lointain
+	neighbor_weights : matrice (nb_tests, K) des poids de vote de ces voisins
+	Les ids de classe suivent l'ordre alphabetique des classes : a total egal, argmax garde le premier,
+	ce qui reproduit le departage alphabetique.
+	Retourne la matrice (nb_tests, K) des ids de classe predits, la colonne i correspondant a k = i+1.
+	"""
+	n_tests, K = neighbor_classes.shape
+	rows = np.arange(n_tests)
+	# -inf pour les classes n'ayant encore recu aucun voisin : elles ne peuvent pas gagner
+	totals = np.full((n_tests, n_classes), -np.inf)
+	predictions = np.empty((n_tests, K), dtype = int)
+	for i in range(K):
+		current = totals[rows, neighbor_classes[:, i]]
+		totals[rows, neighbor_classes[:, i]] = np.where(np.isneginf(current), 0, current) + neighbor_weights[:, i]
+		predictions[:, i] = totals.argmax(axis = 1)
+	return predictions
+
+def class_ids(Y_train):
+	""" Retourne le tableau des classes (triees par ordre alphabetique) et l'id de classe de chaque exemple """
+	classes = np.array(sorted(set(Y_train)))
+	return classes, np.searchsorted(classes, Y_train)
+
 def KNN(classed_matrix, Y_train, Y_test, k):
 	"""
 	We assume classed matrix as a matrix where lines are test and columns are train, so in a line we have cosinus of all 
+	Retourne la matrice (nb_tests, k) des classes predites pour k allant de 1 a k, et le vecteur des classes gold
 	"""
-	global_result = []
+	classes, train_ids = class_ids(Y_train)
+	neighbors = []
+	weights = []
 	for line in classed_matrix :
-		best = sorted([(Y_train[x],line[x]) for x in range(len(line))], key = lambda x : x[1], reverse = True)
+		if sparse.issparse(line) :
+			# les cosinus absents de la matrice creuse sont nuls
+			line = line.toarray().ravel()
 		#Extracts nearests neighbors
-		result = []
-		i_class = defaultdict(int)
-		for i in range(k):
-			i_class[best[i][0]] += best[i][1]
-			top_ones = 0 # top_ones is for preventing list out of range while sorting alphabeticals.
-			classes = sorted(i_class.items(), key = lambda x : x[1], reverse = True)
-			alpha = set()
-			while top_ones < len(classes) and classes[top_ones][1] == classes[0][1] :
-				alpha.add(classes[top_ones][0])
-				top_ones += 1
-			result.append(sorted(alpha)[0])
-		global_result.append((result, Y_test.pop(0)))
-	return global_result
+		top = top_k(line, k)[0]
+		neighbors.append(top)
+		weights.append(line[top])
+	predictions = vote_all_k(train_ids[np.array(neighbors)], np.array(weights), classes.size)
+	return classes[predictions], np.array(Y_test)
+
+def blocked_KNN(X_train, X_test, Y_train, Y_test, k, block_size):
+	"""
+	Meme resultat que KNN(create_cos_matrix(X_train, X_test), Y_train, Y_test, k),
+	mais les exemples de test sont traites par blocs de block_size lignes :
+	seule une matrice block_size x n_train est presente en memoire,
+	et on ne garde que les k meilleurs voisins de chaque ligne du bloc.
+	"""
+	classes, train_ids = class_ids(Y_train)
+	# la matrice d'apprentissage n'est normalisee (et transposee) qu'une fois
+	train_t = normalize_matrix(X_train, return_norm(X_train)).transpose()
+	predictions = []
+	for start in range(0, X_test.shape[0], block_size):
+		block = X_test[start:start + block_size]
+		cos_block = normalize_matrix(block, return_norm(block)).dot(train_t)
+		if sparse.issparse(cos_block) :
+			cos_block = cos_block.toarray()
+		top = top_k(cos_block, k)
+		predictions.append(vote_all_k(train_ids[top], np.take_along_axis(cos_block, top, axis = 1), classes.size))
+	return classes[np.concatenate(predictions)], np.array(Y_test)
+
+class LSH :
+	"""
+	Index approché pour la similarité cosinus, par projections aléatoires signées (LSH) :
+	dans chaque table, un vecteur est haché en n_bits bits (signe de son produit avec n_bits hyperplans aléatoires).
+	Deux vecteurs de cosinus élevé tombent souvent dans le même seau d'au moins une table.
+	- planes : matrice (nb de traits, n_tables * n_bits) des normales aux hyperplans
+	- buckets : pour chaque table, dictionnaire clé de hachage => ids des exemples d'apprentissage
+	"""
+	def __init__(self, X_train, n_tables, n_bits, seed = 0):
+		self.n_tables = n_tables
+		self.n_bits = n_bits
+		self.planes = np.random.default_rng(seed).standard_normal((X_train.shape[1], n_tables * n_bits))
+		self.buckets = []
+		keys = self.hash(X_train)
+		for table in range(n_tables):
+			order = np.argsort(keys[:, table], kind = "stable")
+			values, starts = np.unique(keys[order, table], return_index = True)
+			self.buckets.append(dict(zip(values, np.split(order, starts[1:]))))
+
+	def hash(self, X):
+		""" Matrice (nb de lignes de X, n_tables) des clés de hachage des lignes de X """
+		bits = np.asarray(X.dot(self.planes)) > 0
+		bits = bits.reshape(X.shape[0], self.n_tables, self.n_bits)
+		return (bits * (1 << np.arange(self.n_bits))).sum(axis = 2)
+
+	def candidates(self, X):
+		""" Pour chaque ligne de X, les ids (triés) des exemples d'apprentissage partageant son seau dans au moins une table """
+		empty = np.arange(0)
+		return [np.unique(np.concatenate([self.buckets[table].get(key, empty) for table, key in enumerate(row)]))
+				for row in self.hash(X)]
+
+def lsh_neighbors(X_train, X_test, k, lsh):
+	"""
+	k plus proches voisins approchés : pour chaque exemple de test, les cosinus ne sont calculés
+	que sur les candidats proposés par lsh (sur tous les exemples s'il y a moins de k candidats).
+	Retourne les matrices (nb_tests, k) des ids des voisins et de leurs cosinus,
+	et le nombre total de cosinus calcules.
+	"""
+	train_n = normalize_matrix(X_train, return_norm(X_train))
+	test_n = normalize_matrix(X_test, return_norm(X_test))
+	neighbors = []
+	weights = []
+	n_scored = 0
+	for row, candidates in enumerate(lsh.candidates(test_n)):
+		if candidates.size < k :
+			candidates = np.arange(X_train.shape[0])
+		n_scored += candidates.size
+		line = train_n[candidates].dot(test_n[row:row + 1].transpose())
+		if sparse.issparse(line) :
+			line = line.toarray()
+		line = np.asarray(line).ravel()
+		# les candidats sont triés : a cosinus egal, l'ordre des exemples est conserve
+		top = top_k(line, k)[0]
+		neighbors.append(candidates[top])
+		weights.append(line[top])
+	return np.array(neighbors), np.array(weights), n_scored
+
+def approx_KNN(X_train, X_test, Y_train, Y_test, k, lsh):
+	""" Equivalent approché de KNN(create_cos_matrix(X_train, X_test), Y_train, Y_test, k), voisins cherchés via lsh """
+	classes, train_ids = class_ids(Y_train)
+	neighbors, weights, _ = lsh_neighbors(X_train, X_test, k, lsh)
+	return classes[vote_all_k(train_ids[neighbors], weights, classes.size)], np.array(Y_test)
+
+def lsh_report(X_train, X_test, Y_train, Y_test, k, tables = (1, 2, 4, 8, 16), bits = (4, 8, 12, 16)):
+	"""
+	Compare la recherche approchée (LSH) a la recherche exacte des k plus proches voisins :
+	pour chaque (nb de tables, nb de bits), rappel des k voisins exacts, accuracy pour k,
+	part des cosinus effectivement calcules (y compris les retours a la recherche exacte faute de candidats) et temps de calcul.
+	"""
+	classes, train_ids = class_ids(Y_train)
+	gold = np.array(Y_test)
+	start = time.time()
+	cos_matrix = create_cos_matrix(X_train, X_test)
+	if sparse.issparse(cos_matrix) :
+		cos_matrix = cos_matrix.toarray()
+	exact = top_k(cos_matrix, k)
+	exact_time = time.time() - start
+	exact_acc = (classes[vote_all_k(train_ids[exact], np.take_along_axis(cos_matrix, exact, axis = 1), classes.size)][:, -1] == gold).mean()
+	print("TABLES\tBITS\tRECALL@" + str(k) + "\tACCURACY\tSCORED\tINDEX (s)\tQUERY (s)")
+	print("exact\t-\t100.00%\t{:.2%}\t100.00%\t-\t{:.3f}".format(exact_acc, exact_time))
+	for n_tables in tables :
+		for n_bits in bits :
+			start = time.time()
+			lsh = LSH(X_train, n_tables, n_bits)
+			index_time = time.time() - start
+			start = time.time()
+			neighbors, weights, n_scored = lsh_neighbors(X_train, X_test, k, lsh)
+			query_time = time.time() - start
+			recall = np.mean([np.intersect1d(found, true).size / k for found, true in zip(neighbors, exact)])
+			acc = (classes[vote_all_k(train_ids[neighbors], weights, classes.size)][:, -1] == gold).mean()
+			scored = n_scored / (X_train.shape[0] * X_test.shape[0])
+			print("{}\t{}\t{:.2%}\t{:.2%}\t{:.2%}\t{:.3f}\t{:.3f}".format(n_tables, n_bits, recall, acc, scored, index_time, query_time))
 
 def classify(X_train, Y_train, vec, k):
-	var = KNN(create_cos_matrix(X_train, vec[None,:]), Y_train, ["UNKWOWN"], k)
-	return var[0] 
+	predictions, _ = KNN(create_cos_matrix(X_train, vec[None,:]), Y_train, ["UNKWOWN"], k)
+	return list(predictions[0])
 
 def calc_acc(results, k):
-	acc = [0 for i in range(k)]
-	for result in results :
-		result_example = [1 if result[1]== class_i else 0 for class_i in result[0]]
-		acc = [x + y for x, y in zip(acc, result_example)]
-	return [a / len(results) for a in acc]
+	""" results = (matrice (nb_tests, k) des classes predites, vecteur des classes gold) """
+	predictions, gold = results
+	return (predictions[:, :k] == gold[:, None]).mean(axis = 0)
+
+class BatchingKNN :
+	"""
+	Modele KNN du serveur : la matrice d'apprentissage est normalisee une fois pour toutes,
+	et les vecteurs des requetes concurrentes sont regroupes en lots (au plus max_batch vecteurs,
+	en attendant au plus max_wait secondes), chaque lot etant classe par un seul produit matriciel.
+	"""
+	def __init__(self, X_train, Y_train, indice, k, max_batch = 1024, max_wait = 0.005):
+		self.train_t = normalize_matrix(X_train, return_norm(X_train)).transpose()
+		self.classes, self.train_ids = class_ids(Y_train)
+		self.indice = indice
+		self.k = k
+		self.max_batch = max_batch
+		self.max_wait = max_wait
+		self.requests = queue.Queue()
+		threading.Thread(target = self.run, daemon = True).start()
+
+	def classify(self, vectors):
+		"""
+		Classe une liste de vecteurs (dictionnaires trait => valeur), en attendant le traitement du lot qui les contient.
+		Retourne, pour chaque vecteur, la liste des classes predites pour k allant de 1 a self.k
+		"""
+		if not isinstance(vectors, list) or not all(isinstance(vector, dict) for vector in vectors) :
+			raise TypeError("vectors must be a list of {feature: value} objects")
+		if not vectors :
+			return []
+		# conversion et verification avant la mise en lot : une requete invalide ne doit pas faire echouer tout son lot
+		vectors = [self.check_vector(vector) for vector in vectors]
+		request = SimpleNamespace(vectors = vectors, done = threading.Event(), result = None)
+		self.requests.put(request)
+		request.done.wait()
+		if isinstance(request.result, Exception) :
+			raise request.result
+		return request.result
+
+	@staticmethod
+	def check_vector(vector):
+		""" Copie du vecteur avec des valeurs float finies (ValueError ou TypeError sinon) """
+		checked = {}
+		for feat, val in vector.items() :
+			if isinstance(val, bool) or not isinstance(val, (int, float)) :
+				raise TypeError("value of feature " + repr(feat) + " must be a number, not " + repr(val))
+			try :
+				checked[feat] = float(val)
+			except OverflowError :
+				checked[feat] = inf
+			if not isfinite(checked[feat]) :
+				raise ValueError("value of feature " + repr(feat) + " must be finite, not " + repr(val))
+		return checked
+
+	def run(self):
+		""" Boucle du thread de classification : regroupe les requetes en attente et les traite par lot """
+		while True:
+			batch = [self.requests.get()]
+			n_vectors = len(batch[0].vectors)
+			deadline = time.time() + self.max_wait
+			while n_vectors < self.max_batch :
+				try :
+					batch.append(self.requests.get(timeout = max(0, deadline - time.time())))
+				except queue.Empty :
+					break
+				n_vectors += len(batch[-1].vectors)
+			try :
+				predictions = self.predict([vector for request in batch for vector in request.vectors])
+				start = 0
+				for request in batch :
+					request.result = predictions[start:start + len(request.vectors)]
+					start += len(request.vectors)
+			except Exception as error :
+				# echec du lot : chaque requete est reclassee seule, pour que l'erreur n'atteigne que la requete fautive
+				for request in batch :
+					try :
+						request.result = self.predict(request.vectors) if len(batch) > 1 else error
+					except Exception as request_error :
+						request.result = request_error
+			for request in batch :
+				request.done.set()
+
+	def predict(self, vectors):
+		""" Classes predites (k de 1 a self.k) pour une liste de vecteurs, en un seul produit avec la matrice d'apprentissage """
+		indptr = [0]
+		indices = []
+		data = []
+		norms = []
+		for vector in vectors :
+			# les traits inconnus de l'apprentissage ne comptent que dans la norme
+			for feat, val in vector.items() :
+				if feat in self.indice.words_to_ind :
+					indices.append(self.indice.words_to_ind[feat])
+					data.append(val)
+			indptr.append(len(indices))
+			norms.append(sqrt(sum(val ** 2 for val in vector.values())) or 1)
+		X = sparse.csr_matrix((data, indices, indptr), shape = (len(vectors), self.train_t.shape[0]))
+		cos = normalize_matrix(X, np.array(norms)).dot(self.train_t)
+		cos = cos.toarray() if sparse.issparse(cos) else np.asarray(cos)
+		top = top_k(cos, self.k)
+		predictions = vote_all_k(self.train_ids[top], np.take_along_axis(cos, top, axis = 1), self.classes.size)
+		return self.classes[predictions].tolist()
+
+class KNNRequestHandler(BaseHTTPRequestHandler) :
+	"""
+	POST /classify avec un corps JSON {"vectors": [{trait: valeur, ...}, ...]}
+	repond {"predictions": [[classe pour k = 1, ..., classe pour k = K], ...]}
+	"""
+	protocol_version = "HTTP/1.1"
+	# reponses courtes sur connexion persistante : pas d'attente de Nagle
+	disable_nagle_algorithm = True
+
+	def do_POST(self):
+		if self.path != "/classify" :
+			self.reply(404, {"error" : "unknown path " + self.path})
+			return
+		try :
+			body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+			predictions = self.server.model.classify(body["vectors"])
+		except (ValueError, KeyError, TypeError, AttributeError) as error :
+			self.reply(400, {"error" : str(error)})
+			return
+		self.reply(200, {"predictions" : predictions})
+
+	def reply(self, code, content):
+		reply = json.dumps(content).encode()
+		self.send_response(code)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(reply)))
+		self.end_headers()
+		self.wfile.write(reply)
+
+	def log_message(self, format, *args):
+		if self.server.trace :
+			BaseHTTPRequestHandler.log_message(self, format, *args)
+
+def serve(X_train, Y_train, indice, k, host, port, trace = False):
+	""" Lance le serveur HTTP de classification KNN (jusqu'a interruption) """
+	server = ThreadingHTTPServer((host, port), KNNRequestHandler)
+	server.model = BatchingKNN(X_train, Y_train, indice, k)
+	server.trace = trace
+	sys.stderr.write("KNN server on http://" + host + ":" + str(port) + "/classify (" + str(X_train.shape[0]) + " training examples)\n")
+	try :
+		server.serve_forever()
+	except KeyboardInterrupt :
+		pass
+	server.server_close()
+
+def verify_server(X_train, Y_train, indice, k, n_clients = 20):
+	"""
+	Verifie que, dans un meme lot, une requete invalide n'echoue que pour elle-meme : n_clients requetes valides
+	(des exemples d'apprentissage) sont envoyees en meme temps qu'une requete invalide, d'abord via classify
+	(valeur non numerique, rejetee avant la mise en lot), puis directement dans la file de requetes (le lot
+	echoue et ses requetes sont reclassees une par une). Retourne True si toutes les verifications passent.
+	"""
+	model = BatchingKNN(X_train, Y_train, indice, k, max_wait = 0.05)
+	vectors = []
+	for i in range(min(n_clients, X_train.shape[0])) :
+		row = sparse.csr_matrix(X_train[i])
+		vectors.append({indice.ind_to_words[j] : float(val) for j, val in zip(row.indices, row.data)})
+	expected = [model.predict([vector])[0] for vector in vectors]
+	bad_vector = {indice.ind_to_words[0] : "x"}
+	ok = True
+
+	def client(vector, results, n, raw):
+		barrier.wait()
+		try :
+			if raw :
+				request = SimpleNamespace(vectors = [vector], done = threading.Event(), result = None)
+				model.requests.put(request)
+				request.done.wait()
+				if isinstance(request.result, Exception) :
+					raise request.result
+				results[n] = request.result[0]
+			else :
+				results[n] = model.classify([vector])[0]
+		except Exception as error :
+			results[n] = error
+
+	for raw in (False, True) :
+		results = [None] * (len(vectors) + 1)
+		barrier = threading.Barrier(len(results))
+		clients = [threading.Thread(target = client, args = (vector, results, n, raw)) for n, vector in enumerate(vectors + [bad_vector])]
+		for thread in clients :
+			thread.start()
+		for thread in clients :
+			thread.join()
+		stage = "file de requetes" if raw else "classify"
+		n_good = sum(1 for result, prediction in zip(results, expected) if result == prediction)
+		print("VERIFY SERVER (" + stage + ")\t: ", n_good, "/", len(vectors), "requetes valides correctes, requete invalide :", repr(results[-1]))
+		ok = ok and n_good == len(vectors) and isinstance(results[-1], Exception)
+	print("VERIFY SERVER\t: ", "OK" if ok else "ECHEC")
+	return ok
 
 usage = """ CLASSIFIEUR de DOCUMENTS, de type K-NN
 
@@ -163,7 +633,7 @@ parser = argparse.ArgumentParser(usage = usage)
 parser.add_argument('examples_file', default = None,
 					help = 'Exemples utilisés comme voisins pour la prédiction KNN (au format .examples)')
 
-parser.add_argument('test_file', default = None,
+parser.add_argument('test_file', default = None, nargs = '?',
 					help = 'Exemples de test (au format .examples)')
 
 parser.add_argument('-k', "--k", default = 1, type = int,
@@ -181,6 +651,33 @@ parser.add_argument('-c', "--use_cosinus", action = "store_true",
 parser.add_argument('-t', "--tune", action = "store_true", default = "",
 					help = 'A utiliser pour declencher le tuning des hyperparametres: cos ou dist, avec ou sans ponderation, et figure des performances en fonction de k. Default = False')
 
+parser.add_argument('-s', "--sparse", action = "store_true",
+					help = "Utilise des matrices creuses (CSR) pour les exemples et le produit cosinus. Default = False")
+
+parser.add_argument('-b', "--block_size", default = 0, type = int,
+					help = "Traite les exemples de test par blocs de BLOCK_SIZE lignes, en ne gardant que les k plus proches voisins de chacun : la memoire est bornee par BLOCK_SIZE x nb d'exemples d'apprentissage. Default = 0 (matrice cosinus complete)")
+
+parser.add_argument('-l', "--lsh_tables", default = 0, type = int,
+					help = "Recherche approchee des voisins par LSH (projections aleatoires signees) avec LSH_TABLES tables. Default = 0 (recherche exacte)")
+
+parser.add_argument("--lsh_bits", default = 12, type = int,
+					help = "Nombre de bits (hyperplans) par table LSH. Default = 12")
+
+parser.add_argument("--lsh_report", action = "store_true",
+					help = "Affiche le rappel des k voisins exacts et le temps de calcul pour differents reglages LSH, au lieu de la classification. Default = False")
+
+parser.add_argument("--cache", action = "store_true",
+					help = "Lit les exemples via un cache binaire (FICHIER.cache/), compile au premier usage et recompile si le fichier est plus recent. Default = False")
+
+parser.add_argument("--serve", default = 0, type = int,
+					help = "Mode serveur : charge les exemples d'apprentissage une fois, et classe les vecteurs recus en POST sur http://HOST:SERVE/classify (TEST_FILE est alors inutile). Default = 0 (pas de serveur)")
+
+parser.add_argument("--verify_server", action = "store_true",
+					help = "Verifie qu'une requete invalide envoyee au modele du serveur en meme temps que des requetes valides n'echoue que pour elle-meme, puis s'arrete. Default = False")
+
+parser.add_argument("--host", default = "127.0.0.1",
+					help = 'Pour le mode serveur : adresse d\'ecoute. Default = "127.0.0.1"')
+
 parser.add_argument('-f', "--figure_file", default = "graphique.pdf",
 					help = 'Pour le mode "tune": Base de nom de fichier pour graphique precision en fonction de K. Default = "graphique.pdf".')
 
@@ -188,19 +685,38 @@ args = parser.parse_args()
 
 #------------------------------------------------------------
 indexer = Indice()
-# Chargement des exemples d'apprentissage du classifieur KNN
-training_examples = read_examples(args.examples_file, indexer)
-# Chargement des exemples de test
-test_examples = read_examples(args.test_file, indexer)
-#Creation des matrices
-X_train, Y_train = give_me_the_matrix(training_examples, indexer)
-X_test, Y_test = give_me_the_matrix(test_examples, indexer)
-# Calcul de la matrice cosinus
-cos_matrix = create_cos_matrix(X_train, X_test)
-#Calcul des KNN
-scores = KNN(cos_matrix, Y_train, Y_test, args.k)
+if args.serve > 0 :
+	# Mode serveur : seuls les exemples d'apprentissage sont charges, une fois pour toutes
+	[(X_train, Y_train)] = load_matrices([args.examples_file], indexer, args.cache, args.sparse)
+	serve(X_train, Y_train, indexer, args.k, args.host, args.serve, args.trace)
+	exit(0)
+
+if args.verify_server :
+	[(X_train, Y_train)] = load_matrices([args.examples_file], indexer, args.cache, args.sparse)
+	exit(0 if verify_server(X_train, Y_train, indexer, args.k) else 1)
+
+if args.test_file is None :
+	parser.error("TEST_FILE est obligatoire en dehors du mode serveur")
+# Chargement des exemples d'apprentissage et de test, et creation des matrices
+(X_train, Y_train), (X_test, Y_test) = load_matrices([args.examples_file, args.test_file], indexer, args.cache, args.sparse)
+if args.lsh_report :
+	lsh_report(X_train, X_test, Y_train, Y_test, args.k)
+	exit(0)
+
+if args.lsh_tables > 0 :
+	#Calcul des KNN approches
+	scores = approx_KNN(X_train, X_test, Y_train, Y_test, args.k, LSH(X_train, args.lsh_tables, args.lsh_bits))
+elif args.block_size > 0 :
+	#Calcul des KNN par blocs de lignes de test
+	scores = blocked_KNN(X_train, X_test, Y_train, Y_test, args.k, args.block_size)
+else :
+	# Calcul de la matrice cosinus
+	cos_matrix = create_cos_matrix(X_train, X_test)
+	#Calcul des KNN
+	scores = KNN(cos_matrix, Y_train, Y_test, args.k)
 #Calcul de la precision
 accuracies = calc_acc(scores , args.k)
 
 for i in range(len(accuracies)):
 	print("ACCURACY FOR K =", i+1, "\t: ","{:.2%}".format(accuracies[i]) )
+print("PEAK MEMORY \t: ", "{:.1f} Mo".format(peak_memory()), "(sparse)" if args.sparse else "(dense)")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys, json, time, argparse, threading
+from http.client import HTTPConnection
+from urllib.parse import urlparse
+
+def read_vectors(infile):
+	""" Lit un fichier d'exemples et retourne la liste des (vecteur = dictionnaire trait => valeur, classe gold) """
+	vectors = []
+	for line in open(infile) :
+		line = line[0:-1]
+		if line.startswith("EXAMPLE_NB"):
+			vectors.append(({}, line.split('	')[3]))
+		elif line and vectors:
+			(featname, val) = line.split('	')
+			vectors[-1][0][featname] = float(val)
+	return vectors
+
+def client(url, vectors, batch_size, n_requests, first, latencies, correct, errors):
+	"""
+	Un client : n_requests requetes successives de batch_size vecteurs (pris circulairement a partir de first),
+	sur une meme connexion HTTP. Les latences (en s) sont ajoutees a latencies,
+	le nombre de bonnes reponses pour le K du serveur a correct,
+	et le statut HTTP des requetes refusees par le serveur a errors.
+	"""
+	connection = HTTPConnection(url.hostname, url.port)
+	for r in range(n_requests):
+		batch = [vectors[(first + r * batch_size + i) % len(vectors)] for i in range(batch_size)]
+		body = json.dumps({"vectors" : [vector for vector, gold in batch]}).encode()
+		start = time.time()
+		connection.request("POST", url.path, body, {"Content-Type" : "application/json"})
+		response = connection.getresponse()
+		content = response.read()
+		latencies.append(time.time() - start)
+		if response.status != 200:
+			errors.append(response.status)
+			continue
+		reply = json.loads(content)
+		correct.append(sum(1 for predictions, (vector, gold) in zip(reply["predictions"], batch) if predictions[-1] == gold))
+	connection.close()
+
+def percentile(values, p):
+	return sorted(values)[min(len(values) - 1, int(p * len(values)))]
+
+usage = """ GENERATEUR DE CHARGE pour le serveur KNN (gadioux_knn.py --serve PORT)
+
+  """+sys.argv[0]+""" [options] TEST_FILE
+
+  TEST_FILE est au format *.examples : ses vecteurs sont envoyes par lots au serveur
+
+"""
+
+parser = argparse.ArgumentParser(usage = usage)
+parser.add_argument('test_file', default = None,
+					help = 'Exemples a envoyer au serveur (au format .examples)')
+
+parser.add_argument('-u', "--url", default = "http://127.0.0.1:8000/classify",
+					help = 'Adresse du serveur. Default = "http://127.0.0.1:8000/classify"')
+
+parser.add_argument('-c', "--clients", default = 8, type = int,
+					help = "Nombre de clients concurrents. Default = 8")
+
+parser.add_argument('-b', "--batch_size", default = 1, type = int,
+					help = "Nombre de vecteurs par requete. Default = 1")
+
+parser.add_argument('-n', "--requests", default = 100, type = int,
+					help = "Nombre de requetes par client. Default = 100")
+
+args = parser.parse_args()
+
+#------------------------------------------------------------
+vectors = read_vectors(args.test_file)
+url = urlparse(args.url)
+latencies = []
+correct = []
+errors = []
+clients = [threading.Thread(target = client,
+							args = (url, vectors, args.batch_size, args.requests, c * args.requests * args.batch_size, latencies, correct, errors))
+			for c in range(args.clients)]
+start = time.time()
+for thread in clients :
+	thread.start()
+for thread in clients :
+	thread.join()
+duration = time.time() - start
+
+n_vectors = args.batch_size * len(latencies)
+print("REQUESTS\t: ", len(latencies), "(" + str(n_vectors) + " vectors, " + str(args.clients) + " clients)")
+print("THROUGHPUT\t: ", "{:.1f} requests/s, {:.1f} vectors/s".format(len(latencies) / duration, n_vectors / duration))
+print("LATENCY (ms)\t: ", "p50 = {:.1f}, p90 = {:.1f}, p99 = {:.1f}, max = {:.1f}".format(
+		*[1000 * percentile(latencies, p) for p in (0.5, 0.9, 0.99)], 1000 * max(latencies)))
+print("ERRORS\t\t: ", len(errors), "(" + ", ".join("HTTP {} x {}".format(status, errors.count(status)) for status in sorted(set(errors))) + ")" if errors else "")
+if correct:
+	print("ACCURACY\t: ", "{:.2%}".format(sum(correct) / (args.batch_size * len(correct))))
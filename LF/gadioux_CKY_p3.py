@@ -2,6 +2,20 @@
 # https://youtu.be/GfSvgPP3WLk
 # -*- encoding: utf-8 -*-
 
+import os
+import sys
+import time
+import pickle
+import hashlib
+import heapq
+import random
+import argparse
+import itertools
+import io
+import contextlib
+from multiprocessing import Pool
+import numpy
+
 # ----------------------------------------------------------------------
 # CKY
 # ----------------------------------------------------------------------
@@ -27,14 +41,17 @@ class Symbol:
 class Rule:
 	# field lhs: Symbol
 	# field rhs: list of Symbol
+	# field prob: float (probabilité de la règle, pour l'analyse probabiliste, cf. viterbi)
 	# (no methods)
 	
-	def __init__(self, lhs, rhs):
+	def __init__(self, lhs, rhs, prob=1.0):
 		# lhs: Symbol
 		# rhs: list of Symbol
+		# prob: float
 		
 		self.lhs = lhs
 		self.rhs = rhs
+		self.prob = prob
 		
 	def __str__(self):
 		return str(self.lhs) + " --> [" + ",".join([str(s) for s in self.rhs]) + "]"
@@ -45,8 +62,19 @@ class Grammar:
 	# field rules: list of Rule
 	# field name: String
 	# field nonTerminals: set of Symbol
+	# field binaryIndex: dict (Symbol, Symbol) -> set of Symbol (lhs des règles A --> BC)
+	# field terminalIndex: dict Symbol -> set of Symbol (lhs des règles A --> a)
+	# field nonTerminalList: list of Symbol (non-terminaux triés par nom : le rang est l'id)
+	# field nonTerminalId: dict Symbol -> int
+	# field terminalMask: dict Symbol -> int (masque de bits des ids des A tels que A --> a)
+	# field rightMask: dict int -> int (id de B -> masque des ids des C tels qu'il existe A --> BC)
+	# field lhsMask: dict (int, int) -> int (ids de B et C -> masque des ids des A tels que A --> BC)
+	# field origins: None, ou pour une grammaire obtenue par toCNF : dict (Symbol, tuple of Symbol) -> modèle
+	#                (pour reconstruire les arbres de la grammaire d'origine, cf. originalTree)
 	# method createNewSymbol: String -> Symbol
 	# method isNonTerminal: Symbol -> Boolean
+	# method giveMeLhs: (Symbol, Symbol) -> set of Symbol
+	# method giveMeTerminalLhs: Symbol -> set of Symbol
 		
 	def __init__(self, symbols, axiom, rules, name):
 		# symbols: list of Symbol
@@ -59,9 +87,37 @@ class Grammar:
 		self.rules = rules
 		self.name = name
 		
+		self.origins = None
+
 		self.nonTerminals = set()
 		for rule in rules:
 			self.nonTerminals.add(rule.lhs)
+
+		# Index des règles par partie droite, pour ne pas parcourir toutes les règles à chaque recherche
+		# (calculé une fois pour toutes : les règles ne doivent plus être modifiées ensuite)
+		self.binaryIndex = {}
+		self.terminalIndex = {}
+		for rule in rules:
+			if len(rule.rhs) == 2:
+				self.binaryIndex.setdefault(tuple(rule.rhs), set()).add(rule.lhs)
+			elif len(rule.rhs) == 1:
+				self.terminalIndex.setdefault(rule.rhs[0], set()).add(rule.lhs)
+
+		# Mêmes index avec les non-terminaux numérotés, pour le mode reconnaisseur (cf. recognise)
+		# où un ensemble de non-terminaux est un entier : le bit d'id A vaut 1 si A est dans l'ensemble
+		self.nonTerminalList = sorted(self.nonTerminals, key=lambda symbol: symbol.name)
+		self.nonTerminalId = {symbol: n for n, symbol in enumerate(self.nonTerminalList)}
+		self.terminalMask = {}
+		self.rightMask = {}
+		self.lhsMask = {}
+		for rule in rules:
+			bit = 1 << self.nonTerminalId[rule.lhs]
+			if len(rule.rhs) == 2 and rule.rhs[0] in self.nonTerminalId and rule.rhs[1] in self.nonTerminalId:
+				(b, c) = (self.nonTerminalId[rule.rhs[0]], self.nonTerminalId[rule.rhs[1]])
+				self.rightMask[b] = self.rightMask.get(b, 0) | (1 << c)
+				self.lhsMask[b, c] = self.lhsMask.get((b, c), 0) | bit
+			elif len(rule.rhs) == 1:
+				self.terminalMask[rule.rhs[0]] = self.terminalMask.get(rule.rhs[0], 0) | bit
 	
 	# Returns a new symbol (with a new name build from the argument)
 	def createNewSymbol(self, symbolName):
@@ -94,6 +150,14 @@ class Grammar:
 			if rule.rhs == listOfSymbol :
 				ruleList.add(rule)
 		return ruleList
+
+	def giveMeLhs(self, symbol1, symbol2):
+		# Return the left-hand sides of all rules A --> symbol1 symbol2 (hash lookup).
+		return self.binaryIndex.get((symbol1, symbol2), set())
+
+	def giveMeTerminalLhs(self, terminal):
+		# Return the left-hand sides of all rules A --> terminal (hash lookup).
+		return self.terminalIndex.get(terminal, set())
 		
 	def __str__(self):
 		return "{" +\
@@ -106,6 +170,8 @@ class Tree:
 	# field branches: liste de longueur 1 ou 2 (seules possibilités avec une grammaire en FNC).
 	# Si la longueur est 1, l'element est une liste de 1 symbole.
 	# Si la longueur est 2, les éléments sont eux-mêmes des arbres.
+	# (Les arbres ramenés à une grammaire quelconque, cf. originalTree, ont autant de branches que la
+	# partie droite de la règle, chacune étant un symbole terminal ou un arbre.)
 	# field label: Symbol
 	# (no methods)
 
@@ -113,10 +179,29 @@ class Tree:
 			self.branches = branches
 			self.label = label
 	def __str__(self):
-		if len(self.branches) == 1:
-			return "[ " + self.label.name + ", " + str(self.branches[0]) + " ]"
-		else:
-			return "[ " + self.label.name + ", " + str(self.branches[0]) + ", " + str(self.branches[1]) + " ]"
+		return "[ " + self.label.name + "".join(", " + str(branch) for branch in self.branches) + " ]"
+
+class ForestNode:
+	# Noeud d'une forêt partagée : toutes les analyses d'un même label sur un même sous-mot
+	# field label: Symbol
+	# field backPointers: liste des analyses, chacune de la forme [symbole terminal] ou (ForestNode, ForestNode)
+	# field count: int (nombre d'arbres représentés par le noeud)
+	# method trees: -> générateur de Tree
+
+	def __init__(self, label):
+		self.label = label
+		self.backPointers = []
+		self.count = 0
+
+	def trees(self):
+		# Génère les arbres du noeud un par un, sans jamais les construire tous
+		for backPointer in self.backPointers:
+			if len(backPointer) == 1:
+				yield Tree(self.label, backPointer)
+			else:
+				for left in backPointer[0].trees():
+					for right in backPointer[1].trees():
+						yield Tree(self.label, [left, right])
 
 # Definition of the symbols
 symS = Symbol("S")
@@ -189,6 +274,51 @@ g3 = Grammar(
 	"g3"
 )
 
+# Grammaire ambiguë (cf. le mot abaca plus bas)
+g4 = Grammar(
+	#Alphabet
+	[symS, symA, symB, symC, symTerminalA, symTerminalB, symTerminalC],
+	
+	#Axiom
+	symS,
+	
+	#List of rules
+	[
+		Rule(symS, [symS, symA]),				 #S --> SA
+		Rule(symS, [symTerminalA]),				 #S --> a
+		Rule(symA, [symB, symS]),				 #A --> BS
+		Rule(symA, [symC, symS]),				 #A --> CS
+		Rule(symB, [symTerminalB]),				 #B --> b
+		Rule(symC, [symTerminalC])				 #C --> c
+	],
+	
+	#name
+	"g4"
+)
+
+# Grammaire qui n'est pas en FNC (règles unitaires et vide, cf. g3 de l'analyseur d'Earley)
+g5 = Grammar(
+	# Alphabet
+	[symS, symA, symTerminalA, symTerminalB],
+
+	# Axiom
+	symS,
+
+	# List of rules
+	[
+		Rule(symS, [symA, symS]),					# S --> AS
+		Rule(symS, [symA]),							# S --> A
+		Rule(symA, [symS]),							# A --> S
+		Rule(symS, [symTerminalB]),					# S --> b
+		Rule(symS, [symTerminalB, symTerminalB]),	# S --> bb
+		Rule(symA, []),								# A --> [epsilon]
+		Rule(symA, [symTerminalA])					# A --> a
+	],
+
+	# name
+	"g5"
+)
+
 
 # ----------------------------------------------------------------------
 # Version minimale de l'algorythme CYK
@@ -223,8 +353,9 @@ def init(u, gr) :
 	
 	# Ajout des arbres feuilles
 	for i in range(len(u)) :
-		for rule in gr.giveMeRules([Symbol(u[i])]):
-			T[0,i].add(Tree(rule.lhs, rule.rhs)) 
+		terminal = Symbol(u[i])
+		for lhs in gr.giveMeTerminalLhs(terminal):
+			T[0,i].add(Tree(lhs, [terminal]))
 	return T
 
 
@@ -235,8 +366,8 @@ def loop(T, u, gr) :
 			for k in range(i):						# Nombre de lettre après la première où la subdivision a lieu.
 				for symb1 in T[k,j]:				# Tous les arbres pour générer la partie gauche
 					for symb2 in T[i-1-k,j+1+k]:	# Tous les arbres pour générer la partie droite
-						for rule in gr.giveMeRules([symb1.label, symb2.label]): # Pour chaque règle générant les arbres, ajouter l'arbre correspondant
-							T[i,j].add(Tree(rule.lhs, [symb1, symb2]))
+						for lhs in gr.giveMeLhs(symb1.label, symb2.label): # Pour chaque règle générant les arbres, ajouter l'arbre correspondant
+							T[i,j].add(Tree(lhs, [symb1, symb2]))
 
 "Création de la table d'analyse du mot u pour la grammaire gr"
 def buildTable(u, gr):
@@ -254,6 +385,218 @@ def printT(T, n):
 		print("")
 
 
+# ----------------------------------------------------------------------
+# Mode reconnaisseur : chaque case R[i, j] est un entier, masque de bits
+# des ids des non-terminaux qui génèrent le sous-mot (et non plus un
+# ensemble d'arbres, dont le nombre explose avec une grammaire ambiguë).
+# Une règle A --> BC s'applique à tous les C de la case droite à la fois
+# (un ET bit à bit avec rightMask[B]) ; une seule analyse est conservée
+# par non-terminal et par case (pointeurs arrière), d'où un temps et une
+# mémoire polynomiaux quelle que soit l'ambiguïté.
+# ----------------------------------------------------------------------
+
+"Ids des bits à 1 du masque mask"
+def bits(mask):
+	while mask:
+		low = mask & -mask
+		yield low.bit_length() - 1
+		mask ^= low
+
+"Création et remplissage de la table R du mot u pour la grammaire gr en mode reconnaisseur, et des pointeurs arrière"
+def recognise(u, gr):
+	# back[i, j] : dict id de A -> (k, id de B, id de C), la subdivision et la règle d'une analyse de A
+	R = {}
+	back = {}
+	for j in range(len(u)):
+		R[0, j] = gr.terminalMask.get(Symbol(u[j]), 0)
+		back[0, j] = {}
+
+	for i in range(1, len(u)) :
+		for j in range(len(u)-i) :
+			mask = 0
+			pointers = {}
+			for k in range(i):
+				left = R[k, j]
+				right = R[i-1-k, j+1+k]
+				if not left or not right:
+					continue
+				for b in bits(left):
+					for c in bits(right & gr.rightMask.get(b, 0)):
+						new = gr.lhsMask[b, c] & ~mask
+						if new:
+							mask |= new
+							for a in bits(new):
+								pointers[a] = (k, b, c)
+			R[i, j] = mask
+			back[i, j] = pointers
+	return (R, back)
+
+"Reconstruit, à partir des pointeurs arrière, un arbre du non-terminal d'id a pour le sous-mot (i, j) de u"
+def recogniserTree(back, u, gr, i, j, a):
+	label = gr.nonTerminalList[a]
+	if i == 0:
+		return Tree(label, [Symbol(u[j])])
+	(k, b, c) = back[i, j][a]
+	return Tree(label, [recogniserTree(back, u, gr, k, j, b), recogniserTree(back, u, gr, i-1-k, j+1+k, c)])
+
+"Affichage d'une table R (mode reconnaisseur) pour un mot de taille n"
+def printR(R, n, gr):
+	for i in range(n-1,-1,-1):
+		print("|", end = "")
+		for j in range(n-i):
+			print(" ".join(str(gr.nonTerminalList[a]) for a in bits(R[i,j])) if R[i,j] else " ", end = " |")
+		print("")
+
+"Une fois la table R remplie, détermine si l'analyse a réussi"
+def isRecognised(R, u, gr):
+	return gr.axiom in gr.nonTerminalId and bool(R[len(u)-1, 0] >> gr.nonTerminalId[gr.axiom] & 1)
+
+# ----------------------------------------------------------------------
+# Forêt partagée : chaque case F[i, j] est un dict label -> ForestNode,
+# un seul noeud par label et par sous-mot, avec la liste de ses analyses
+# (pointeurs vers les noeuds fils). La table a une taille polynomiale, le
+# nombre d'arbres est calculé en même temps qu'elle, et les arbres sont
+# générés à la demande (ForestNode.trees).
+# ----------------------------------------------------------------------
+
+"Création et remplissage de la forêt partagée F du mot u pour la grammaire gr"
+def buildForest(u, gr):
+	F = {}
+	for j in range(len(u)):
+		terminal = Symbol(u[j])
+		F[0, j] = {}
+		for lhs in gr.giveMeTerminalLhs(terminal):
+			node = F[0, j][lhs] = ForestNode(lhs)
+			node.backPointers.append([terminal])
+			node.count = 1
+
+	for i in range(1, len(u)) :
+		for j in range(len(u)-i) :
+			F[i, j] = {}
+			for k in range(i):
+				for left in F[k, j].values():
+					for right in F[i-1-k, j+1+k].values():
+						for lhs in gr.giveMeLhs(left.label, right.label):
+							if lhs not in F[i, j]:
+								F[i, j][lhs] = ForestNode(lhs)
+							node = F[i, j][lhs]
+							node.backPointers.append((left, right))
+							node.count += left.count * right.count
+	return F
+
+"Nombre d'arbres d'analyse du mot u (pour la forêt F)"
+def countTrees(F, u, gr):
+	root = F[len(u)-1, 0].get(gr.axiom)
+	return root.count if root else 0
+
+"Génère un par un les arbres d'analyse du mot u (pour la forêt F)"
+def forestTrees(F, u, gr):
+	root = F[len(u)-1, 0].get(gr.axiom)
+	return root.trees() if root else iter([])
+
+"Affichage d'une forêt F pour un mot de taille n"
+def printF(F, n):
+	for i in range(n-1,-1,-1):
+		print("|", end = "")
+		for j in range(n-i):
+			print(" ".join(str(label) for label in F[i,j]) if F[i,j] else " ", end = " |")
+		print("")
+
+# ----------------------------------------------------------------------
+# CKY probabiliste (Viterbi) : la table est un tableau numpy C[i, j, A]
+# de taille (n, n, |N|), log-probabilité de la meilleure analyse par A du
+# sous-mot (i, j) (-inf si aucune). Pour une longueur i, on boucle sur
+# les subdivisions k ; pour chaque k, toutes les positions j et toutes
+# les règles A --> BC applicables sont calculées d'un coup :
+# C[k, j, B] + C[i-1-k, j+1+k, C], dont on garde le max sur k. On ajoute
+# ensuite log P(r), puis on prend le max par partie gauche A. Les
+# pointeurs arrière (subdivision et règle) sont aussi des tableaux
+# (n, n, |N|).
+# ----------------------------------------------------------------------
+
+class CompiledPCFG:
+	# Grammaire probabiliste en FNC compilée en tableaux numpy (non-terminaux numérotés comme gr.nonTerminalId)
+	# field grammar: Grammar
+	# field lexical: dict Symbol -> numpy array (|N|) des log P(A --> a)
+	# field ruleLhs, ruleLeft, ruleRight: numpy arrays des ids de A, B et C des règles A --> BC, triées par A
+	# field ruleLogProb: numpy array des log P(A --> BC)
+	# field groupStarts: numpy array, indice de la première règle de chaque partie gauche
+	# field groupLhs: numpy array, id de la partie gauche de chaque groupe
+
+	def __init__(self, gr):
+		self.grammar = gr
+		nbNonTerminals = len(gr.nonTerminalList)
+		self.lexical = {}
+		binary = []
+		for rule in gr.rules:
+			if rule.prob <= 0:
+				continue
+			a = gr.nonTerminalId[rule.lhs]
+			if len(rule.rhs) == 1:
+				scores = self.lexical.setdefault(rule.rhs[0], numpy.full(nbNonTerminals, -numpy.inf))
+				scores[a] = max(scores[a], numpy.log(rule.prob))
+			elif rule.rhs[0] in gr.nonTerminalId and rule.rhs[1] in gr.nonTerminalId:
+				binary.append((a, gr.nonTerminalId[rule.rhs[0]], gr.nonTerminalId[rule.rhs[1]], numpy.log(rule.prob)))
+		binary.sort()
+		self.ruleLhs = numpy.array([r[0] for r in binary], dtype=numpy.int64)
+		self.ruleLeft = numpy.array([r[1] for r in binary], dtype=numpy.int64)
+		self.ruleRight = numpy.array([r[2] for r in binary], dtype=numpy.int64)
+		self.ruleLogProb = numpy.array([r[3] for r in binary], dtype=numpy.float64)
+		(self.groupLhs, self.groupStarts) = numpy.unique(self.ruleLhs, return_index=True)
+
+"Création et remplissage de la table probabiliste C du mot u pour la grammaire compilée pcfg, et des pointeurs arrière"
+def viterbi(u, pcfg):
+	n = len(u)
+	nbNonTerminals = len(pcfg.grammar.nonTerminalList)
+	nbRules = len(pcfg.ruleLhs)
+	C = numpy.full((n, n, nbNonTerminals), -numpy.inf)
+	backSplit = numpy.zeros((n, n, nbNonTerminals), dtype=numpy.int32)
+	backRule = numpy.full((n, n, nbNonTerminals), -1, dtype=numpy.int32)
+	for j in range(n):
+		if Symbol(u[j]) in pcfg.lexical:
+			C[0, j] = pcfg.lexical[Symbol(u[j])]
+
+	if nbRules == 0:
+		return (C, backSplit, backRule)
+	counts = numpy.diff(numpy.append(pcfg.groupStarts, nbRules))
+	for i in range(1, n) :
+		m = n-i
+		# best[j, r] = meilleur score de la règle r pour le sous-mot (i, j), atteint pour la subdivision split[j, r] ;
+		# pour chaque subdivision k, les cases gauches (k, j) et droites (i-1-k, j+1+k) de tous les j sont contiguës
+		best = numpy.full((m, nbRules), -numpy.inf)
+		split = numpy.zeros((m, nbRules), dtype=numpy.int32)
+		for k in range(i):
+			left = C[k, :m]
+			right = C[i-1-k, k+1:k+1+m]
+			# seules les règles dont B et C sont présents dans au moins une case peuvent s'appliquer
+			rules = numpy.flatnonzero(numpy.isfinite(left).any(axis=0)[pcfg.ruleLeft] & numpy.isfinite(right).any(axis=0)[pcfg.ruleRight])
+			if len(rules) == 0:
+				continue
+			scores = left[:, pcfg.ruleLeft[rules]] + right[:, pcfg.ruleRight[rules]]
+			current = best[:, rules]
+			split[:, rules] = numpy.where(scores > current, k, split[:, rules])
+			best[:, rules] = numpy.maximum(current, scores)
+		best += pcfg.ruleLogProb
+		# max par partie gauche, et première règle l'atteignant
+		groupBest = numpy.maximum.reduceat(best, pcfg.groupStarts, axis=1)
+		reached = best == numpy.repeat(groupBest, counts, axis=1)
+		rule = numpy.minimum.reduceat(numpy.where(reached, numpy.arange(nbRules), nbRules), pcfg.groupStarts, axis=1)
+		j = numpy.arange(n-i)[:, None]
+		C[i, j, pcfg.groupLhs] = groupBest
+		backRule[i, j, pcfg.groupLhs] = rule
+		backSplit[i, j, pcfg.groupLhs] = split[j, rule]
+	return (C, backSplit, backRule)
+
+"Reconstruit, à partir des pointeurs arrière, le meilleur arbre du non-terminal d'id a pour le sous-mot (i, j) de u"
+def viterbiTree(backSplit, backRule, u, pcfg, i, j, a):
+	label = pcfg.grammar.nonTerminalList[a]
+	if i == 0:
+		return Tree(label, [Symbol(u[j])])
+	k = int(backSplit[i, j, a])
+	r = backRule[i, j, a]
+	return Tree(label, [viterbiTree(backSplit, backRule, u, pcfg, k, j, int(pcfg.ruleLeft[r])),
+						viterbiTree(backSplit, backRule, u, pcfg, i-1-k, j+1+k, int(pcfg.ruleRight[r]))])
+
 # ----------------------------------------------------------------------
 # L'algo est entièrement codé dans les trois fonctions précédentes, les
 # fonctions qui suivent servent uniquement à afficher les résultats,
@@ -270,7 +613,7 @@ def printTree(T, u, gr):
 	#print all trees in top emplacement if they are axiom
 	for tree in T[len(u)-1,0] :
 		if gr.axiom == tree.label :
-			print(tree)
+			print(originalTree(tree, gr))
 
 "Vérifie que la grammaire est en forme normale de Chomsky"
 def checkCNF(gr):
@@ -287,14 +630,257 @@ def checkCNF(gr):
 			return False
 	return True
 
-"Fonction globale d'analyse syntaxique"
-def parse(u, gr):
+# ----------------------------------------------------------------------
+# Mise en forme normale de Chomsky : START (nouvel axiome), TERM (les
+# terminaux des parties droites longues sont remplacés par des
+# non-terminaux), BIN (découpage des parties droites longues), DEL
+# (suppression des règles vides) et UNIT (suppression des règles A --> B).
+# Chaque règle obtenue garde un modèle du fragment d'arbre de la grammaire
+# d'origine qu'elle représente, ce qui permet de ramener les arbres
+# d'analyse à la grammaire d'origine (cf. originalTree). Un modèle est :
+#   ("child", i) : l'arbre (ou la liste de branches) du i-ème fils,
+#   ("const", x) : un arbre fixe (dérivation vide d'un symbole supprimé),
+#   ("node", label, parts) : un noeud label, dont les branches sont les
+#   expansions de parts ; si label vaut None (symbole créé par la
+#   conversion), les branches sont insérées telles quelles dans le parent.
+# ----------------------------------------------------------------------
+
+CNF_CACHE = "cnf.cache"
+CNF_VERSION = 2 # version de toCNF, à incrémenter à chaque changement de la conversion (invalide le cache)
+
+"Expansion du modèle template, étant donné les expansions children des fils de la règle"
+def expandTemplate(template, children):
+	if template[0] == "child":
+		return children[template[1]]
+	if template[0] == "const":
+		return template[1]
+	(kind, label, parts) = template
+	branches = []
+	for part in parts:
+		expansion = expandTemplate(part, children)
+		if isinstance(expansion, list):
+			branches.extend(expansion)
+		else:
+			branches.append(expansion)
+	return Tree(label, branches) if label is not None else branches
+
+"Remplace dans template chaque fils i par le modèle mapping[i]"
+def substituteTemplate(template, mapping):
+	if template[0] == "child":
+		return mapping[template[1]]
+	if template[0] == "const":
+		return template
+	return ("node", template[1], [substituteTemplate(part, mapping) for part in template[2]])
+
+"Mise en forme normale de Chomsky de la grammaire gr (les probabilités sont multipliées le long des règles vides et unitaires supprimées ; si une règle est obtenue de plusieurs façons, on garde la plus probable)"
+def toCNF(gr):
+	# Les règles en cours de conversion sont des tuples (lhs, rhs, prob, modèle)
+	work = Grammar(list(gr.symbols), gr.axiom, [], gr.name)
+	def newSymbol(name):
+		symbol = work.createNewSymbol(name)
+		work.symbols.append(symbol)
+		return symbol
+	rules = [(r.lhs, list(r.rhs), r.prob, ("node", r.lhs, [("child", n) for n in range(len(r.rhs))])) for r in gr.rules]
+
+	# START : nouvel axiome, qui n'apparaît dans aucune partie droite
+	axiom = newSymbol(gr.axiom.name + "0")
+	rules.append((axiom, [gr.axiom], 1.0, ("node", None, [("child", 0)])))
+
+	# TERM : a --> T_a dans les parties droites d'au moins deux symboles
+	terminalSymbols = {}
+	for (lhs, rhs, prob, template) in list(rules):
+		if len(rhs) < 2:
+			continue
+		for n, symbol in enumerate(rhs):
+			if not gr.isNonTerminal(symbol):
+				if symbol not in terminalSymbols:
+					terminalSymbols[symbol] = newSymbol("T_" + symbol.name)
+					rules.append((terminalSymbols[symbol], [symbol], 1.0, ("node", None, [("child", 0)])))
+				rhs[n] = terminalSymbols[symbol]
+
+	# BIN : A --> X1 X2 ... Xk devient A --> X1 A_1, A_1 --> X2 A_2, ..., A_k-2 --> Xk-1 Xk
+	# (les règles longues sont encore celles d'origine : leur modèle est ("node", A, [fils 0 à k-1]))
+	binary = []
+	for (lhs, rhs, prob, template) in rules:
+		if len(rhs) <= 2:
+			binary.append((lhs, rhs, prob, template))
+			continue
+		(label, current) = (template[1], lhs)
+		for n in range(len(rhs) - 2):
+			helper = newSymbol(lhs.name + "_" + str(n + 1))
+			binary.append((current, [rhs[n], helper], prob if n == 0 else 1.0, ("node", label, [("child", 0), ("child", 1)])))
+			(label, current) = (None, helper)
+		binary.append((current, rhs[-2:], 1.0, ("node", None, [("child", 0), ("child", 1)])))
+	rules = binary
+
+	# DEL : symboles annulables et leur meilleure dérivation vide (probabilité maximale, calculée par point fixe),
+	# puis variantes des règles sans les symboles annulables, dont la probabilité inclut celle des dérivations vides retirées
+	empty = {}
+	changed = True
+	while changed:
+		changed = False
+		for (lhs, rhs, prob, template) in rules:
+			if all(symbol in empty for symbol in rhs):
+				emptyProb = prob
+				for symbol in rhs:
+					emptyProb *= empty[symbol][0]
+				if lhs not in empty or emptyProb > empty[lhs][0]:
+					empty[lhs] = (emptyProb, expandTemplate(template, [empty[symbol][1] for symbol in rhs]))
+					changed = True
+	withoutEmpty = []
+	for (lhs, rhs, prob, template) in rules:
+		for kept in itertools.product(*[[True, False] if symbol in empty else [True] for symbol in rhs]):
+			if not any(kept):
+				continue
+			newRhs = [symbol for symbol, keep in zip(rhs, kept) if keep]
+			newProb = prob
+			mapping = []
+			for n, (symbol, keep) in enumerate(zip(rhs, kept)):
+				if keep:
+					mapping.append(("child", len([k for k in kept[:n] if k])))
+				else:
+					mapping.append(("const", empty[symbol][1]))
+					newProb *= empty[symbol][0]
+			withoutEmpty.append((lhs, newRhs, newProb, substituteTemplate(template, mapping)))
+	rules = withoutEmpty
+
+	# Symboles productifs (qui dérivent un mot non vide) : les règles qui en utilisent d'autres sont retirées
+	# (non terminaux qui ne dérivaient que le mot vide, ou cycles A --> B --> A sans autre règle)
+	productive = set(symbol for symbol in gr.symbols if not gr.isNonTerminal(symbol))
+	changed = True
+	while changed:
+		changed = False
+		for (lhs, rhs, prob, template) in rules:
+			if lhs not in productive and all(symbol in productive for symbol in rhs):
+				productive.add(lhs)
+				changed = True
+	rules = [(lhs, rhs, prob, template) for (lhs, rhs, prob, template) in rules if all(symbol in productive for symbol in rhs)]
+	lhsSymbols = set(lhs for (lhs, rhs, prob, template) in rules)
+
+	# UNIT : A --> B suivie de B --> alpha (non unitaire) devient A --> alpha
+	units = {}
+	others = {}
+	for (lhs, rhs, prob, template) in rules:
+		if len(rhs) == 1 and rhs[0] in lhsSymbols:
+			units.setdefault(lhs, []).append((rhs[0], prob, template))
+		else:
+			others.setdefault(lhs, []).append((rhs, prob, template))
+	# Une même règle A --> alpha peut être obtenue de plusieurs façons : on garde la plus probable (et son modèle)
+	best = {}
+	for lhs in [axiom] + [symbol for symbol in work.symbols if symbol in lhsSymbols and symbol != axiom]:
+		# B atteignables par règles unitaires, avec la chaîne A --> ... --> B la plus probable et son modèle
+		# (Dijkstra sur les produits de probabilités, qui ne peuvent que décroître le long d'une chaîne)
+		reached = {}
+		heap = [(-1.0, 0, lhs, ("child", 0))]
+		counter = 1
+		while heap:
+			(chainProb, n, symbol, chain) = heapq.heappop(heap)
+			if symbol in reached:
+				continue
+			reached[symbol] = (-chainProb, chain)
+			for (target, prob, template) in units.get(symbol, []):
+				if target not in reached:
+					heapq.heappush(heap, (chainProb * prob, counter, target, substituteTemplate(chain, [template])))
+					counter += 1
+		for symbol, (chainProb, chain) in reached.items():
+			for (rhs, prob, template) in others.get(symbol, []):
+				key = (lhs, tuple(rhs))
+				if key not in best or chainProb * prob > best[key][0]:
+					best[key] = (chainProb * prob, substituteTemplate(chain, [template]))
+
+	cnf = Grammar(work.symbols, axiom, [Rule(lhs, list(rhs), prob) for (lhs, rhs), (prob, template) in best.items()], gr.name + " (FNC)")
+	cnf.origins = {key: template for key, (prob, template) in best.items()}
+	return cnf
+
+"Empreinte de la grammaire gr (symboles, axiome, règles et probabilités) et de la version de la conversion"
+def grammarHash(gr):
+	description = repr((CNF_VERSION, gr.axiom.name, [s.name for s in gr.symbols], [(r.lhs.name, [s.name for s in r.rhs], r.prob) for r in gr.rules]))
+	return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+"Forme normale de Chomsky de gr, lue dans le cache cacheDir si elle a déjà été calculée (clé : empreinte de gr)"
+def compileCNF(gr, cacheDir=CNF_CACHE):
+	path = os.path.join(cacheDir, grammarHash(gr) + ".pickle")
+	if os.path.exists(path):
+		with open(path, "rb") as stream:
+			return pickle.load(stream)
+	cnf = toCNF(gr)
+	os.makedirs(cacheDir, exist_ok=True)
+	with open(path + ".tmp", "wb") as stream:
+		pickle.dump(cnf, stream)
+	os.replace(path + ".tmp", path)
+	return cnf
+
+"Ramène un arbre d'analyse de la grammaire gr à la grammaire d'origine si gr a été obtenue par toCNF"
+def originalTree(tree, gr):
+	if gr.origins is None:
+		return tree
+	expansion = unbinarise(tree, gr)
+	return expansion[0] if isinstance(expansion, list) else expansion
+
+"Expansion (arbre ou liste de branches) d'un arbre de la grammaire FNC gr dans la grammaire d'origine"
+def unbinarise(tree, gr):
+	if isinstance(tree.branches[0], Tree):
+		children = [unbinarise(branch, gr) for branch in tree.branches]
+		rhs = tuple(branch.label for branch in tree.branches)
+	else:
+		children = list(tree.branches)
+		rhs = tuple(tree.branches)
+	return expandTemplate(gr.origins[tree.label, rhs], children)
+
+"Fonction globale d'analyse syntaxique (reconnaisseur : une seule analyse, par les pointeurs arrière ; forêt : nombre d'arbres, et au plus maxTrees arbres affichés ; probabiliste : la meilleure analyse ; convert : mise en FNC, avec le cache cacheDir)"
+def parse(u, gr, recogniser=False, forest=False, maxTrees=None, probabilistic=False, convert=False, cacheDir=CNF_CACHE):
 	print("--- \"" + u + "\" - " + gr.name + " ---")
 	
+	if convert:
+		gr = compileCNF(gr, cacheDir)
+
 	if not checkCNF(gr):
 		print("la grammaire n'est pas en forme normale de Chomsky!")
 		return None
 	
+	if recogniser:
+		(R, back) = recognise(u, gr)
+		print("table d'analyse :")
+		printR(R, len(u), gr)
+		print("")
+		if isRecognised(R, u, gr):
+			print("le mot est généré par la grammaire")
+			print("")
+			print("arbre :")
+			print(originalTree(recogniserTree(back, u, gr, len(u)-1, 0, gr.nonTerminalId[gr.axiom]), gr))
+		else:
+			print("le mot N'est PAS généré par la grammaire")
+		return
+
+	if probabilistic:
+		pcfg = CompiledPCFG(gr)
+		(C, backSplit, backRule) = viterbi(u, pcfg)
+		axiom = gr.nonTerminalId.get(gr.axiom)
+		if axiom is not None and C[len(u)-1, 0, axiom] > -numpy.inf:
+			print("le mot est généré par la grammaire")
+			print("")
+			print("meilleur arbre (log-probabilité " + str(C[len(u)-1, 0, axiom]) + ") :")
+			print(originalTree(viterbiTree(backSplit, backRule, u, pcfg, len(u)-1, 0, axiom), gr))
+		else:
+			print("le mot N'est PAS généré par la grammaire")
+		return
+
+	if forest:
+		F = buildForest(u, gr)
+		print("table d'analyse :")
+		printF(F, len(u))
+		print("")
+		nbTrees = countTrees(F, u, gr)
+		if nbTrees:
+			print("le mot est généré par la grammaire")
+			print("")
+			print("arbres (" + str(nbTrees) + ") :")
+			for tree in itertools.islice(forestTrees(F, u, gr), maxTrees):
+				print(originalTree(tree, gr))
+		else:
+			print("le mot N'est PAS généré par la grammaire")
+		return
+
 	T = buildTable(u, gr)
 	
 	print("table d'analyse :")
@@ -310,37 +896,281 @@ def parse(u, gr):
 		print("le mot N'est PAS généré par la grammaire")
 
 
-parse("bb", g1)
-print("")
+"Affecte aux règles de gr des probabilités aléatoires (normalisées par partie gauche)"
+def randomProbabilities(gr, seed=0):
+	rng = random.Random(seed)
+	for rule in gr.rules:
+		rule.prob = rng.random()
+	total = {}
+	for rule in gr.rules:
+		total[rule.lhs] = total.get(rule.lhs, 0) + rule.prob
+	for rule in gr.rules:
+		rule.prob /= total[rule.lhs]
 
-parse("abb", g1)
-print("")
+# ----------------------------------------------------------------------
+# Benchmark de la recherche des règles : index (giveMeLhs) contre parcours
+# de toutes les règles (giveMeRules), sur une grammaire FNC aléatoire
+# ----------------------------------------------------------------------
 
-parse("aaab", g2)
-print("")
+class UnindexedGrammar(Grammar):
+	# Grammaire sans index : chaque recherche parcourt toutes les règles (comme giveMeRules)
 
-" Facultatif: parser le mot abaca avec la grammaire ambiguë. Doit afficher deux arbres d'analyse."
+	def giveMeLhs(self, symbol1, symbol2):
+		return set(rule.lhs for rule in self.giveMeRules([symbol1, symbol2]))
 
+	def giveMeTerminalLhs(self, terminal):
+		return set(rule.lhs for rule in self.giveMeRules([terminal]))
 
-g4 = Grammar(
-	#Alphabet
-	[symS, symA, symB, symC, symTerminalA, symTerminalB, symTerminalC],
-	
-	#Axiom
-	symS,
-	
-	#List of rules
-	[
-		Rule(symS, [symS, symA]),				 #S --> SA
-		Rule(symS, [symTerminalA]),				 #S --> a
-		Rule(symA, [symB, symS]),				 #A --> BS
-		Rule(symA, [symC, symS]),				 #A --> CS
-		Rule(symB, [symTerminalB]),				 #B --> b
-		Rule(symC, [symTerminalC])				 #C --> c
-	],
-	
-	#name
-	"g4"
-)
+"Génère une grammaire en FNC aléatoire : nbRules règles binaires sur nbNonTerminals non-terminaux, chaque terminal ayant nbLhs parties gauches"
+def generateCNFGrammar(nbNonTerminals, nbRules, terminals, nbLhs=2, seed=0, grammarClass=Grammar):
+	rng = random.Random(seed)
+	nonTerminals = [Symbol("N" + str(n)) for n in range(nbNonTerminals)]
+	terminalSymbols = [Symbol(t) for t in terminals]
+	rules = []
+	for (b, c) in rng.sample([(b, c) for b in range(nbNonTerminals) for c in range(nbNonTerminals)], nbRules):
+		rules.append(Rule(rng.choice(nonTerminals), [nonTerminals[b], nonTerminals[c]]))
+	for terminal in terminalSymbols:
+		for lhs in rng.sample(nonTerminals, nbLhs):
+			rules.append(Rule(lhs, [terminal]))
+	return grammarClass(nonTerminals + terminalSymbols, nonTerminals[0], rules, "random CNF")
+
+"Compare les temps de remplissage de la table avec et sans index des règles"
+def benchmark(nbNonTerminals, nbRules, wordLength, nbWords, seed=0):
+	terminals = "abcdefghij"
+	rng = random.Random(seed)
+	words = ["".join(rng.choice(terminals) for n in range(wordLength)) for w in range(nbWords)]
+	print("grammaire : %d non-terminaux, %d règles binaires ; %d mots de longueur %d" % (nbNonTerminals, nbRules, nbWords, wordLength))
+	for grammarClass in [UnindexedGrammar, Grammar]:
+		gr = generateCNFGrammar(nbNonTerminals, nbRules, terminals, seed=seed, grammarClass=grammarClass)
+		start = time.time()
+		nbTrees = 0
+		nbSuccess = 0
+		for u in words:
+			T = buildTable(u, gr)
+			nbTrees += sum(len(cell) for cell in T.values())
+			nbSuccess += isSuccess(T, u, gr)
+		print("%s\t: %.3f s (%d arbres, %d mots reconnus)" % (grammarClass.__name__, time.time() - start, nbTrees, nbSuccess))
+	start = time.time()
+	nbSuccess = 0
+	for u in words:
+		(R, back) = recognise(u, gr)
+		nbSuccess += isRecognised(R, u, gr)
+	print("recognise\t: %.3f s (%d mots reconnus)" % (time.time() - start, nbSuccess))
+
+"Temps de l'analyse probabiliste (Viterbi) de mots aléatoires, avec une grammaire aléatoire"
+def viterbiBenchmark(nbNonTerminals, nbRules, wordLength, nbWords, seed=0):
+	terminals = "abcdefghij"
+	rng = random.Random(seed)
+	words = ["".join(rng.choice(terminals) for n in range(wordLength)) for w in range(nbWords)]
+	gr = generateCNFGrammar(nbNonTerminals, nbRules, terminals, seed=seed)
+	randomProbabilities(gr, seed)
+	start = time.time()
+	pcfg = CompiledPCFG(gr)
+	print("grammaire : %d non-terminaux, %d règles binaires (compilée en %.3f s) ; %d mots de longueur %d" % (nbNonTerminals, nbRules, time.time() - start, nbWords, wordLength))
+	start = time.time()
+	nbSuccess = 0
+	for u in words:
+		(C, backSplit, backRule) = viterbi(u, pcfg)
+		if gr.axiom in gr.nonTerminalId and C[len(u)-1, 0, gr.nonTerminalId[gr.axiom]] > -numpy.inf:
+			nbSuccess += 1
+			viterbiTree(backSplit, backRule, u, pcfg, len(u)-1, 0, gr.nonTerminalId[gr.axiom])
+	print("viterbi\t: %.3f s par mot (%d mots analysés)" % ((time.time() - start) / nbWords, nbSuccess))
+
+"Compare les temps d'analyse des mots a(ba)^m, de plus en plus ambigus pour g4, en mode arbres, reconnaisseur et forêt"
+def ambiguityBenchmark(maxM):
+	for m in range(1, maxM + 1):
+		u = "a" + "ba" * m
+		start = time.time()
+		T = buildTable(u, g4)
+		treeTime = time.time() - start
+		start = time.time()
+		(R, back) = recognise(u, g4)
+		recogniserTime = time.time() - start
+		start = time.time()
+		F = buildForest(u, g4)
+		print("%s\t: arbres %.3f s (%d arbres pour l'axiome)\treconnaisseur %.4f s\tforêt %.4f s (%d arbres)" % (u, treeTime,
+			sum(1 for tree in T[len(u)-1, 0] if tree.label == g4.axiom), recogniserTime, time.time() - start, countTrees(F, u, g4)))
+
+
+# ----------------------------------------------------------------------
+# Analyse par lots : la grammaire est vérifiée et compilée une seule fois,
+# puis transmise à chaque processus (cf. initBatch) ; les phrases sont
+# réparties sur les processus et les résultats reviennent dans l'ordre.
+# ----------------------------------------------------------------------
+
+class ParseResult:
+	# Résultat de l'analyse d'une phrase par parseBatch
+	# field sentence: String
+	# field success: Boolean
+	# field tree: String (une analyse, la meilleure en mode probabiliste) ou None
+	# field nbTrees: int (modes arbres et forêt) ou None
+	# field logProb: float (mode probabiliste) ou None
+	# field table: String (affichage de la table d'analyse) ou None (mode silencieux)
+	# field time: float (durée de l'analyse, en secondes)
+
+	def __init__(self, sentence):
+		self.sentence = sentence
+		self.success = False
+		self.tree = None
+		self.nbTrees = None
+		self.logProb = None
+		self.table = None
+		self.time = 0
+
+	def __str__(self):
+		score = self.logProb if self.logProb is not None else self.nbTrees
+		return "\t".join([self.sentence, "1" if self.success else "0", "" if score is None else str(score),
+						  "%.2f" % (1000 * self.time), self.tree or ""])
+
+# Grammaire (et sa compilation probabiliste), mode d'analyse et mode silencieux des processus d'analyse, cf. initBatch
+batchGrammar = None
+batchPCFG = None
+batchMode = "trees"
+batchQuiet = True
+
+MODES = ["trees", "recogniser", "forest", "probabilistic"]
+
+def initBatch(gr, pcfg, mode, quiet):
+	# Initialisation d'un processus d'analyse : grammaire déjà vérifiée et compilée
+	global batchGrammar, batchPCFG, batchMode, batchQuiet
+	batchGrammar = gr
+	batchPCFG = pcfg
+	batchMode = mode
+	batchQuiet = quiet
+
+"Analyse de la phrase u avec la grammaire du processus (cf. initBatch)"
+def parseSentence(u):
+	gr = batchGrammar
+	result = ParseResult(u)
+	start = time.time()
+	table = io.StringIO()
+	if batchMode == "trees":
+		T = buildTable(u, gr)
+		trees = [tree for tree in T[len(u)-1, 0] if tree.label == gr.axiom]
+		result.nbTrees = len(trees)
+		result.success = bool(trees)
+		# arbre rapporté : le premier dans l'ordre des chaînes (l'ordre des arbres d'une case n'est pas déterministe)
+		result.tree = min(str(originalTree(tree, gr)) for tree in trees) if trees else None
+		if not batchQuiet:
+			with contextlib.redirect_stdout(table):
+				printT(T, len(u))
+	elif batchMode == "recogniser":
+		(R, back) = recognise(u, gr)
+		result.success = isRecognised(R, u, gr)
+		result.tree = str(originalTree(recogniserTree(back, u, gr, len(u)-1, 0, gr.nonTerminalId[gr.axiom]), gr)) if result.success else None
+		if not batchQuiet:
+			with contextlib.redirect_stdout(table):
+				printR(R, len(u), gr)
+	elif batchMode == "forest":
+		F = buildForest(u, gr)
+		result.nbTrees = countTrees(F, u, gr)
+		result.success = result.nbTrees > 0
+		result.tree = str(originalTree(next(forestTrees(F, u, gr)), gr)) if result.success else None
+		if not batchQuiet:
+			with contextlib.redirect_stdout(table):
+				printF(F, len(u))
+	else:
+		(C, backSplit, backRule) = viterbi(u, batchPCFG)
+		axiom = gr.nonTerminalId.get(gr.axiom)
+		if axiom is not None and C[len(u)-1, 0, axiom] > -numpy.inf:
+			result.success = True
+			result.logProb = float(C[len(u)-1, 0, axiom])
+			result.tree = str(originalTree(viterbiTree(backSplit, backRule, u, batchPCFG, len(u)-1, 0, axiom), gr))
+	result.time = time.time() - start
+	if not batchQuiet and batchMode != "probabilistic":
+		result.table = table.getvalue()
+	return result
 
-parse("abaca", g4)
+"Analyse des phrases sentences (itérable de String) avec la grammaire gr (mise en FNC si convert, avec le cache cacheDir), sur jobs processus : génère les ParseResult dans l'ordre des phrases"
+def parseBatch(sentences, gr, mode="trees", jobs=1, quiet=True, chunksize=8, convert=False, cacheDir=CNF_CACHE):
+	if convert:
+		gr = compileCNF(gr, cacheDir)
+	if not checkCNF(gr):
+		raise ValueError("la grammaire " + gr.name + " n'est pas en forme normale de Chomsky")
+	pcfg = CompiledPCFG(gr) if mode == "probabilistic" else None
+	sentences = (u for u in sentences if u)
+	if jobs > 1:
+		with Pool(jobs, initializer=initBatch, initargs=(gr, pcfg, mode, quiet)) as pool:
+			for result in pool.imap(parseSentence, sentences, chunksize):
+				yield result
+	else:
+		initBatch(gr, pcfg, mode, quiet)
+		for u in sentences:
+			yield parseSentence(u)
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--benchmark", action="store_true", help="Compare la recherche des règles avec et sans index sur une grammaire aléatoire, puis s'arrête")
+	parser.add_argument("--nonterminals", type=int, default=100, help="Nb de non-terminaux de la grammaire aléatoire. Default=100")
+	parser.add_argument("--rules", type=int, default=3000, help="Nb de règles binaires de la grammaire aléatoire. Default=3000")
+	parser.add_argument("--length", type=int, default=6, help="Longueur des mots analysés par le benchmark. Default=6")
+	parser.add_argument("--words", type=int, default=20, help="Nb de mots analysés par le benchmark. Default=20")
+	parser.add_argument("--ambiguity", type=int, default=0, help="Benchmark des mots a(ba)^m, m <= AMBIGUITY, avec la grammaire ambiguë g4, puis s'arrête. Default=0")
+	parser.add_argument("--viterbi", action="store_true", help="Benchmark de l'analyse probabiliste sur une grammaire aléatoire, puis s'arrête")
+	parser.add_argument("-r", "--recogniser", action="store_true", help="Analyse en mode reconnaisseur (une seule analyse par mot)")
+	parser.add_argument("-f", "--forest", action="store_true", help="Analyse en forêt partagée (nombre d'arbres, arbres générés à la demande)")
+	parser.add_argument("-k", "--max_trees", type=int, default=None, help="En mode forêt, nb maximal d'arbres affichés par mot. Default=tous")
+	parser.add_argument("-p", "--probabilistic", action="store_true", help="Analyse probabiliste : meilleure analyse selon les probabilités des règles (Viterbi)")
+	parser.add_argument("--batch", default=None, help="Analyse toutes les phrases (une par ligne) du fichier BATCH ('-' : entrée standard), puis s'arrête. Default=None")
+	parser.add_argument("-g", "--grammar", choices=["g1", "g2", "g3", "g4", "g5", "random"], default="g1", help="Grammaire de l'analyse par lots (random : grammaire aléatoire, cf. --nonterminals et --rules). Default=g1")
+	parser.add_argument("-j", "--jobs", type=int, default=1, help="Nb de processus de l'analyse par lots. Default=1")
+	parser.add_argument("-q", "--quiet", action="store_true", help="Analyse par lots sans affichage des tables d'analyse")
+	parser.add_argument("-c", "--cnf", action="store_true", help="Met la grammaire en forme normale de Chomsky avant l'analyse (arbres ramenés à la grammaire d'origine)")
+	parser.add_argument("--cnf_cache", default=CNF_CACHE, help="Répertoire du cache des grammaires mises en FNC. Default=" + CNF_CACHE)
+	args = parser.parse_args()
+
+	if args.benchmark:
+		benchmark(args.nonterminals, args.rules, args.length, args.words)
+		sys.exit(0)
+
+	if args.viterbi:
+		viterbiBenchmark(args.nonterminals, args.rules, args.length, args.words)
+		sys.exit(0)
+
+	if args.ambiguity:
+		ambiguityBenchmark(args.ambiguity)
+		sys.exit(0)
+
+	if args.batch:
+		if args.grammar == "random":
+			gr = generateCNFGrammar(args.nonterminals, args.rules, "abcdefghij")
+			randomProbabilities(gr)
+		else:
+			gr = {"g1": g1, "g2": g2, "g3": g3, "g4": g4, "g5": g5}[args.grammar]
+		mode = "recogniser" if args.recogniser else "forest" if args.forest else "probabilistic" if args.probabilistic else "trees"
+		stream = sys.stdin if args.batch == "-" else open(args.batch)
+		start = time.time()
+		nbSentences = 0
+		if args.cnf:
+			gr = compileCNF(gr, args.cnf_cache)
+		if not checkCNF(gr):
+			parser.error("la grammaire " + gr.name + " n'est pas en forme normale de Chomsky (utiliser -c pour la convertir)")
+		for result in parseBatch((line.strip() for line in stream), gr, mode, args.jobs, args.quiet):
+			nbSentences += 1
+			if result.table:
+				print(result.table, end="")
+			print(result)
+		duration = time.time() - start
+		sys.stderr.write("%d phrases en %.2f s (%.1f phrases/s)\n" % (nbSentences, duration, nbSentences / duration if duration else 0))
+		sys.exit(0)
+
+	parse("bb", g1, args.recogniser, args.forest, args.max_trees, args.probabilistic)
+	print("")
+
+	parse("abb", g1, args.recogniser, args.forest, args.max_trees, args.probabilistic)
+	print("")
+
+	parse("aaab", g2, args.recogniser, args.forest, args.max_trees, args.probabilistic)
+	print("")
+
+	" Facultatif: parser le mot abaca avec la grammaire ambiguë. Doit afficher deux arbres d'analyse."
+
+
+	parse("abaca", g4, args.recogniser, args.forest, args.max_trees, args.probabilistic)
+	print("")
+
+	" Grammaire qui n'est pas en FNC : mise en FNC automatique, les arbres sont ramenés à la grammaire d'origine"
+
+	for u in ["aab", "b", "abab"]:
+		parse(u, compileCNF(g5, args.cnf_cache), args.recogniser, args.forest, args.max_trees, args.probabilistic)
+		print("")
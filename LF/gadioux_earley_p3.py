@@ -1,16 +1,39 @@
 # -*- encoding: utf8 -*-
 
+import time
+import random
+import argparse
+from collections import deque
+
 # -----
 # Cette implémentation peut donner plus d'une analyse dans le cas de grammaire avec récursivité indirecte, cependant, il n'y a pas de boucle infinie possible.
 
 class Symbol:
 	# field name: String
+	# field id: Integer (identifiant entier du symbole)
 	# (no methods)
+	# Les symboles sont internés : Symbol(name) renvoie toujours le même objet pour un même nom,
+	# on peut donc les comparer (et les indexer) par leur id plutôt que par leur nom.
+	
+	__slots__ = ("name", "id")
+	table = {} # Symboles déjà créés, par nom
 	
-	def __init__(self, name):
+	def __new__(cls, name):
 		# name: String
 		
-		self.name = name;
+		symbol = Symbol.table.get(name)
+		if symbol is None:
+			symbol = object.__new__(cls)
+			symbol.name = name
+			symbol.id = len(Symbol.table)
+			Symbol.table[name] = symbol
+		return symbol
+	
+	def __eq__(self, other):
+		return self is other
+	
+	def __hash__(self):
+		return self.id
 	
 	def __str__(self):
 		return self.name;
@@ -18,6 +41,7 @@ class Symbol:
 class Rule:
 	# field lhs: Symbol
 	# field rhs: list of Symbol
+	# field id: Integer (indice de la règle dans sa grammaire, cf. Grammar)
 	# (no methods)
 	
 	def __init__(self, lhs, rhs):
@@ -26,6 +50,7 @@ class Rule:
 		
 		self.lhs = lhs;
 		self.rhs = rhs;
+		self.id = None;
 		
 	def __str__(self):
 		return str(self.lhs) + " --> [" + ",".join([str(s) for s in self.rhs]) + "]";
@@ -36,6 +61,7 @@ class Grammar:
 	# field rules: list of Rule
 	# field nonTerminals: set of Symbol
 	# field name: String
+	# field rulesByLhs: dict Integer -> list of Rule (règles indexées par l'id de leur partie gauche)
 	# method createNewSymbol: String -> Symbol
 	# method isNonTerminal: Symbol -> Boolean
 		
@@ -53,6 +79,12 @@ class Grammar:
 		self.nonTerminals = set();
 		for rule in rules:
 			self.nonTerminals.add(rule.lhs)
+		
+		# Les items pointent les règles par leur id (cf. Item) : les règles ne doivent plus être modifiées ensuite
+		self.rulesByLhs = {}
+		for n, rule in enumerate(rules):
+			rule.id = n
+			self.rulesByLhs.setdefault(rule.lhs.id, []).append(rule)
 	
 	# Returns a new symbol (with a new name build from the argument)
 	def createNewSymbol(self, symbolName):
@@ -88,48 +120,80 @@ class Grammar:
 class Item:
 	# field i: Integer
 	# field j: Integer
-	# field lhs: Symbol
-	# field bd: list of Symbol
-	# field ad: list of Symbol
+	# field rule: Rule
+	# field dot: Integer (position du point dans rule.rhs)
+	# field next: Symbol, ou None si l'item est inactif (symbole qui suit le point)
 	# field tree: class Tree usefull for the syntax tree
+	# field key: tuple (i, j, id de la règle, dot), sur lequel portent l'égalité et le hachage (l'arbre n'en fait pas partie)
+	# lhs, bd et ad (partie gauche, avant et après le point) sont calculés à la demande à partir de rule et dot.
+	# Les items sont immuables.
+	
+	__slots__ = ("i", "j", "rule", "dot", "next", "tree", "key", "hashValue")
+	
+	def __init__(self, i, j, rule, dot, tree = None): # [lhs --> bd . ad, i, j] avec bd = rule.rhs[:dot], ad = rule.rhs[dot:]
+		setField = object.__setattr__
+		setField(self, "i", i)
+		setField(self, "j", j)
+		setField(self, "rule", rule)
+		setField(self, "dot", dot)
+		setField(self, "next", rule.rhs[dot] if dot < len(rule.rhs) else None)
+		setField(self, "tree", tree)
+		setField(self, "key", (i, j, rule.id, dot))
+		setField(self, "hashValue", hash(self.key))
+	
+	def __setattr__(self, name, value):
+		raise AttributeError("Item est immuable")
 	
-	def __init__(self, i, j, lhs, bd, ad, tree = None): # [lhs --> bd . ad, i, j]
-		self.i = i
-		self.j = j
-		self.lhs = lhs
-		self.bd = bd
-		self.ad = ad
-		self.tree = tree
+	@property
+	def lhs(self):
+		return self.rule.lhs
+	
+	@property
+	def bd(self):
+		return self.rule.rhs[:self.dot]
+	
+	@property
+	def ad(self):
+		return self.rule.rhs[self.dot:]
 		
 	def __str__(self):
 		return "[%d, %d, %s --> %s * %s]" % \
 			(self.i, self.j, str(self.lhs), ",".join([str(s) for s in self.bd]), ",".join([str(s) for s in self.ad]))
 			
 	def __eq__(self, other):
-		return self.i == other.i and self.j == other.j and \
-			self.lhs == other.lhs and self.bd == other.bd and self.ad == other.ad
+		return self.key == other.key
 
 	def __hash__(self):
-		return str(self).__hash__()
+		return self.hashValue
 			
 class ParseChart:
 	# field ch: list of Item
 	# field chset: set of Item
-	# field ag: list of Item
+	# field ag: deque of Item
+	# field active: dict (Integer, Integer) -> list of Item (items actifs [i, j, A --> bd * B ad] indexés par (j, id de B))
+	# field complete: dict (Integer, Integer) -> list of Item (items inactifs [i, j, A --> bd *] indexés par (i, id de A))
+	# field verbose: Boolean (affichage des logs)
 	# method agAppend: Item -> (void)
 	# method chAppend: Item -> (void)
+	# method activeItems: (Integer, Symbol) -> list of Item
+	# method completeItems: (Integer, Symbol) -> list of Item
 	
 	ch = [] # Chart
-	ag = [] # Agenda
+	ag = deque() # Agenda
 	
-	def __init__(self):
+	def __init__(self, verbose = True):
 		self.ch = []
 		self.chset = set()
-		self.ag = []
+		self.ag = deque()
+		self.active = {}
+		self.complete = {}
+		self.verbose = verbose
 		
 	# Adds an item at the end of the agenda (+ prints some log)
 	def agAppend(self, item, reason = None):
 		self.ag.append(item)
+		if not self.verbose:
+			return
 		if reason != None:
 			print("    " + str(item) + " appended to the agenda (" + reason + ")")
 		else:
@@ -142,15 +206,40 @@ class ParseChart:
 		if item not in self.chset :
 			self.ch.append(item)
 			self.chset.add(item)
+			# Index des items de la chart, pour que comp n'ait pas à parcourir toute la chart
+			if item.next is not None :
+				self.active.setdefault((item.j, item.next.id), []).append(item)
+			else :
+				self.complete.setdefault((item.i, item.rule.lhs.id), []).append(item)
+			if not self.verbose:
+				return True
 			if reason != None:
 				print( str(item) + " appended to the chart (" + reason + ")")
 			else:
 				print( str(item) + " appended to the chart")
 			return True
 		else :
-			print( str(item) + " already in chart !")
+			if self.verbose:
+				print( str(item) + " already in chart !")
 			return False
 
+	# Items actifs de la chart qui finissent en j et attendent le symbole symbol (dans l'ordre de la chart)
+	def activeItems(self, j, symbol):
+		return self.active.get((j, symbol.id), [])
+
+	# Items inactifs de la chart qui commencent en i et ont pour partie gauche lhs (dans l'ordre de la chart)
+	def completeItems(self, i, lhs):
+		return self.complete.get((i, lhs.id), [])
+
+class UnindexedParseChart(ParseChart):
+	# Chart sans index : activeItems et completeItems parcourent toute la chart (pour comparaison, cf. benchmark)
+
+	def activeItems(self, j, symbol):
+		return [item for item in self.ch if item.next is symbol and item.j == j]
+
+	def completeItems(self, i, lhs):
+		return [item for item in self.ch if item.next is None and item.i == i and item.rule.lhs is lhs]
+
 class Tree:
 	# field branches: liste de Tree.
 	# field label: Symbol
@@ -170,9 +259,8 @@ def init(g, w, t):
 	# g: Grammar
 	# w: list of Symbol
 	# t: ParseChart
-	for rule in g.rules :
-		if rule.lhs == g.axiom :	# Ajout des règles axiomatiques et ajout de l'arbre vide
-			t.agAppend( Item(0, 0, g.axiom, [], rule.rhs, Tree( g.axiom, [] ) ), "Init" )
+	for rule in g.rulesByLhs.get(g.axiom.id, []) :	# Ajout des règles axiomatiques et ajout de l'arbre vide
+		t.agAppend( Item(0, 0, rule, 0, Tree( g.axiom, [] ) ), "Init" )
 
 # Insère dans l'agenda les éventuels nouveaux items issus de la règle pred ou scan pour l'item it
 def pred_scan(g, w, it, t):
@@ -180,20 +268,21 @@ def pred_scan(g, w, it, t):
 	# w: list of Symbol
 	# it: Item
 	# t: ParseChart
-	if it.ad : # Si la règle est active.
+	if it.next is not None : # Si la règle est active.
 		#Pred
-		if g.isNonTerminal(it.ad[0]) :
-			for rule in g.rules :	# Recherche des règles pouvant être produite à partir de la tête de la partie encore active de l'item.
-				if rule.lhs.name == it.ad[0].name and not ( len(rule.rhs) == 1 and rule.lhs.name == rule.rhs[0].name ):
+		if g.isNonTerminal(it.next) :
+			for rule in g.rulesByLhs[it.next.id] :	# Règles pouvant être produites à partir de la tête de la partie encore active de l'item.
+				if not ( len(rule.rhs) == 1 and rule.lhs is rule.rhs[0] ):
 					# Ajout de l'item et de son arbre vide
-					t.agAppend( Item(it.j, it.j, rule.lhs, [], rule.rhs, Tree( rule.lhs, [] )  ), "Pred") 
+					t.agAppend( Item(it.j, it.j, rule, 0, Tree( rule.lhs, [] )  ), "Pred") 
 
 		else :
+			rhs = it.rule.rhs
 			j = it.j
-			while (j < len(w) and len(it.ad) > j-it.j and w[j].name == it.ad[j-it.j].name) :
+			while (j < len(w) and len(rhs) > it.dot + j-it.j and w[j] is rhs[it.dot + j-it.j]) :
 				j+=1
 			if j != it.j:
-				t.agAppend( Item(it.i, j, it.lhs, it.bd + it.ad[:(j-it.j)], it.ad[(j-it.j):], tree = Tree( it.lhs ,w[it.i:j]) ), "Scan") # Ajout egalement de l'arbre syntaxique produit par la regle.
+				t.agAppend( Item(it.i, j, it.rule, it.dot + j-it.j, tree = Tree( it.rule.lhs ,w[it.i:j]) ), "Scan") # Ajout egalement de l'arbre syntaxique produit par la regle.
 
 
 # Insère dans l'agenda les éventuels nouveaux items issus de la règle comp pour l'item it
@@ -204,25 +293,23 @@ def comp(g, w, it, t):
 	# t: ParseChart
 	
 	b = False
-	if it.ad :
-		for item in t.ch :	# Parcours des autres item de la chart.
-			if not item.ad : 	 # Si l'item principal est actif
-				b += comp_help(it, item, t)
+	if it.next is not None :
+		for item in t.completeItems(it.j, it.next) :	# Items inactifs qui commencent où l'item principal (actif) s'arrête.
+			b += comp_help(it, item, t)
 	else :
-		for item in t.ch :	# Parcours des autres item de la chart.
-			if item.ad : # Si l'autre item est inactif
-				b += comp_help(item, it, t)
+		for item in t.activeItems(it.i, it.rule.lhs) :	# Items actifs qui attendent la partie gauche de l'item principal (inactif).
+			b += comp_help(item, it, t)
 	return b
 
 def comp_help(act, inact, t):
 	# Fonction de support de comp qui prend en entrée deux item, un actif et l'autre inactif ainsi qu'une table T.
 	# La fonction tente ensuite une compilation.
-	if act.j == inact.i and act.ad[0].name == inact.lhs.name :
+	if act.j == inact.i and act.next is inact.rule.lhs :
 		
 		# Calcul de l'arbre d'analyse
 		tree = Tree( act.tree.label, act.tree.branches + [inact.tree] ) 
 
-		t.agAppend( Item(act.i, inact.j, act.lhs, act.bd + [act.ad[0]], act.ad[1:], tree = tree ), "Comp")
+		t.agAppend( Item(act.i, inact.j, act.rule, act.dot + 1, tree = tree ), "Comp")
 		#les arbres sont egalement gérés au dessus.
 		return True
 	return False
@@ -233,31 +320,36 @@ def table_complete(g, w, t):
 	# w: list of Symbol
 	# t: ParseChart
 	axioms = []
-	for item in t.ch : # Verifie si l'item est l'axiome, qu'il a bien lu tout le mot et que la regle est inactive.
-		if item.lhs.name == g.axiom.name and not item.i and item.j == len(w) and not item.ad :
+	for item in t.completeItems(0, g.axiom) : # Items inactifs de l'axiome qui commencent en 0 : verifie qu'ils ont bien lu tout le mot.
+		if item.j == len(w) :
 			axioms.append(item)
 	
 	return axioms
 
 # Parse le mot w pour la grammaire g ; retourne le chart à la fin de l'algorithme
-def parse_earley(g, w):
+def parse_earley(g, w, verbose = True, chartClass = ParseChart):
 	# g: Grammar
 	# w: list of Symbol
+	# verbose: Boolean (affichage des logs et des arbres)
+	# chartClass: classe de la chart (ParseChart, ou UnindexedParseChart pour comparaison)
 	
-	T = ParseChart()
+	T = chartClass(verbose)
 	
 	# Initialisation
 	init(g, w, T)
 	
 	# Boucle sur l'agenda : on sort un item, on l'insère dans la chart, et toutes ses conséquences sont insérées dans l'agenda
-	while T.ag != []:
-		it = T.ag.pop(0) # Sortie de l'agenda
-		print("")	
+	while T.ag:
+		it = T.ag.popleft() # Sortie de l'agenda
+		if verbose:
+			print("")	
 		if T.chAppend(it) :		# Ajout dans la table
 			if not comp(g, w, it, T) :	#Calcul de comp
 				pred_scan(g, w, it ,T)	# Calcul de pred et scan
 	
 	trees = table_complete(g, w, T) #Recherche des analyses correctes
+	if not verbose:
+		return T.ch
 	if len(trees):
 		print( "\n****Parsing réussi****" )
 		for tree in trees :
@@ -336,10 +428,6 @@ g3 = Grammar(
 	"g3"
 )
 
-print( g3 )
-
-words = ["aab", "b", "aaaaab", "abab"]
-
 # Transform a word (as a String) to the symbolic representation (a list of terminal symbols)
 def wordToTerminals(w, g):
 	# w: String
@@ -362,6 +450,43 @@ def wordToTerminals(w, g):
 				
 	return result
 
+# Compare les temps d'analyse de mots aléatoires de plus en plus longs, avec et sans index de la chart
+def benchmark(g, lengths, nbWords, seed = 0):
+	# g: Grammar
+	# lengths: list of Integer
+	# nbWords: Integer (nb de mots par longueur)
+	rng = random.Random(seed)
+	terminals = [s.name for s in g.symbols if not g.isNonTerminal(s)]
+	print("grammaire " + g.name + " : " + str(nbWords) + " mots aléatoires par longueur")
+	for length in lengths:
+		words = [wordToTerminals("".join(rng.choice(terminals) for n in range(length)), g) for k in range(nbWords)]
+		times = []
+		for chartClass in [UnindexedParseChart, ParseChart]:
+			start = time.time()
+			nbItems = 0
+			nbSuccess = 0
+			for w in words:
+				chart = parse_earley(g, w, False, chartClass)
+				nbItems += len(chart)
+				nbSuccess += len([item for item in chart if item.rule.lhs is g.axiom and not item.i and item.j == len(w) and item.next is None]) > 0
+			times.append(time.time() - start)
+		print("longueur %d\t: %.3f s sans index, %.3f s avec index (%d items, %d mots reconnus)" % (length, times[0], times[1], nbItems, nbSuccess))
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--benchmark", action="store_true", help="Compare les temps d'analyse avec et sans index de la chart, puis s'arrête")
+parser.add_argument("--grammar", choices=["g1", "g2", "g3"], default="g3", help="Grammaire du benchmark. Default=g3")
+parser.add_argument("--lengths", type=int, nargs="+", default=[10, 20, 40, 60], help="Longueurs des mots du benchmark. Default=10 20 40 60")
+parser.add_argument("--words", type=int, default=5, help="Nb de mots par longueur. Default=5")
+args = parser.parse_args()
+
+if args.benchmark:
+	benchmark({"g1": g1, "g2": g2, "g3": g3}[args.grammar], args.lengths, args.words)
+	exit(0)
+
+print( g3 )
+
+words = ["aab", "b", "aaaaab", "abab"]
+
 for w in words:
 	print( "\n#### Mot : " + w + " ####")
 	